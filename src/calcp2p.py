@@ -0,0 +1,301 @@
+"""
+Node daemon and command line for calcp2p.
+
+    python calcp2p.py serve --config node.yml
+    python calcp2p.py run command/example.yml --shards 'data/*.csv' --peer 10.0.0.2:7000
+
+`serve` starts a worker node: a TCP server answering plan requests, plus
+the discovery backends and static peers from the configuration. `run`
+executes a plan locally, or across peers when any are configured, and
+prints the results as JSON.
+
+Only what a command needs is imported, and backends named in the
+configuration (zeroconf discovery, the multi-core and incremental
+executors) are imported only when enabled. `--timings` reports how long each startup phase took.
+"""
+import time
+
+_STARTED = time.perf_counter()
+
+import argparse
+import importlib
+import json
+import socket
+import sys
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+# Backends loaded by name, as "module:attribute", only when configured
+DISCOVERY_BACKENDS = {
+    "zeroconf": "net.mdns:ZeroconfService",
+}
+EXECUTORS = {
+    "local": "command.engine:Executor",
+    "parallel": "command.parallel:ParallelExecutor",
+    "incremental": "command.incremental:IncrementalExecutor",
+}
+
+DEFAULTS: dict[str, Any] = {
+    "host": "0.0.0.0",
+    "port": 7000,
+    "advertise": None,
+    "discovery": [],
+    "peers": [],
+    "shards": [],
+    "processes": None,
+    "memory_budget": None,
+    "cache_bytes": 256 << 20,
+    # Directory of per-file partial states; local runs then only read new or changed files
+    "state": None,
+}
+
+
+class Timings:
+    """Wall time of each startup phase, counted from when this module started executing."""
+
+    def __init__(self):
+        self.phases: dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def report(self) -> str:
+        phases = ", ".join(f"{name} {seconds * 1e3:.1f}ms" for name, seconds in self.phases.items())
+        return f"Started in {(time.perf_counter() - _STARTED) * 1e3:.1f}ms ({phases})"
+
+
+def load_backend(spec: str) -> Any:
+    module, _, attribute = spec.partition(":")
+    return getattr(importlib.import_module(module), attribute)
+
+
+def load_config(path: str | None, overrides: dict[str, Any]) -> dict[str, Any]:
+    config = dict(DEFAULTS)
+    if path is not None:
+        with open(path) as f:
+            if path.endswith(".json"):
+                config.update(json.load(f))
+            else:
+                import yaml
+
+                config.update(yaml.safe_load(f) or {})
+    config.update({key: value for key, value in overrides.items() if value is not None})
+
+    unknown = set(config["discovery"]) - DISCOVERY_BACKENDS.keys()
+    if unknown:
+        raise ValueError(f"Unknown discovery backends {sorted(unknown)}, expected {sorted(DISCOVERY_BACKENDS)}")
+    if isinstance(config["shards"], str):
+        config["shards"] = [config["shards"]]
+    return config
+
+
+def free_port(host: str) -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+def advertised_ip(config: dict[str, Any]) -> str:
+    if config["advertise"]:
+        return config["advertise"]
+    if config["host"] not in ("0.0.0.0", ""):
+        return config["host"]
+    return socket.gethostbyname(socket.gethostname())
+
+
+def build_network(config: dict[str, Any], port: int | None = None):
+    """
+    Network with the configured static peers and discovery backends started.
+
+    Only a node serving on `port` announces itself; without one, e.g. for
+    `run`, discovery just looks for workers, since peers would otherwise
+    schedule partitions onto a port nobody serves.
+    """
+    from uuid import NAMESPACE_URL, uuid5
+
+    from net.node import Network, Node
+    from net.tcp import TCPConnection
+
+    network = Network()
+    for peer in config["peers"]:
+        host, _, peer_port = peer.rpartition(":")
+        # Static peers do not announce an id, so derive a stable one from the address
+        node = Node(uuid5(NAMESPACE_URL, f"tcp://{host}:{peer_port}"))
+        node.add_connection(TCPConnection(host, int(peer_port)))
+        network.add_node(node)
+
+    for name in config["discovery"]:
+        backend = load_backend(DISCOVERY_BACKENDS[name])
+        network.add_discovery(backend(network.host_id, advertised_ip(config), port or config["port"],
+                                      broadcast=port is not None))
+    return network
+
+
+def serve(config: dict[str, Any], timings: Timings):
+    with timings.phase("imports"):
+        from net.tcp import TCPServer
+        from command.cache import ResultCache
+        from command.distributed import Worker, expand
+
+    with timings.phase("network"):
+        port = config["port"] or free_port(config["host"])
+        shards = expand(config["shards"])
+        cache = ResultCache(config["cache_bytes"]) if config["cache_bytes"] else None
+        worker = Worker(shards, cache, config["processes"], config["memory_budget"])
+        network = build_network(config, port)
+        server = TCPServer(config["host"], port, worker.handle)
+        network.add_discovery(server)
+
+    print(timings.report())
+    print(f"Serving {len(shards)} shards on {config['host']}:{port}, host ID {network.host_id}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for discovery in list(network.discoveries):
+            network.remove_discovery(discovery)
+
+
+def jsonable(value: Any) -> Any:
+    """Results with tuple group keys, e.g. groupby((a, b)), as JSON."""
+    if isinstance(value, dict):
+        return {k if isinstance(k, (str, int, float)) else str(k): jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [jsonable(v) for v in value]
+    return value
+
+
+def run(config: dict[str, Any], args: argparse.Namespace, timings: Timings) -> dict[str, Any]:
+    with timings.phase("imports"):
+        from command.plan import Plan
+        from command.engine import expand
+
+    plan = Plan.load(args.plan)
+    # Without shards from the command line, configuration or plan, each peer runs its own
+    shards = expand(config["shards"] or plan.data) or None
+    distributed = bool(config["peers"] or config["discovery"])
+    if not distributed and shards is None:
+        raise ValueError("No shards to read: pass --shards, set shards in the configuration or data in the plan")
+    if config["state"] and (distributed or config["processes"]):
+        raise ValueError("Incremental state is only kept by single-process local runs")
+
+    profiler = None
+    if args.trace:
+        from command import tracing
+
+        tracing.enable()
+        if args.profile:
+            profiler = tracing.SamplingProfiler(tracing.TRACER, args.profile)
+            profiler.start()
+
+    try:
+        if not distributed:
+            with timings.phase("imports"):
+                backend = "incremental" if config["state"] else "parallel" if config["processes"] else "local"
+                executor_class = load_backend(EXECUTORS[backend])
+            if config["state"]:
+                executor = executor_class(plan, config["state"], config["memory_budget"])
+            elif config["processes"]:
+                executor = executor_class(plan, config["processes"], memory_budget=config["memory_budget"])
+            else:
+                executor = executor_class(plan, config["memory_budget"])
+            if args.timings:
+                print(timings.report(), file=sys.stderr)
+            try:
+                return executor.finalize(executor.run(shards))
+            finally:
+                if config["processes"]:
+                    executor.close()
+
+        with timings.phase("imports"):
+            import asyncio
+
+            from command.cache import ResultCache
+            from command.distributed import DistributedExecutor
+        with timings.phase("network"):
+            network = build_network(config)
+        if args.timings:
+            print(timings.report(), file=sys.stderr)
+        if config["discovery"]:
+            time.sleep(args.discover)
+
+        # Peers answer cache lookups for partitions they ran before
+        cache = ResultCache(config["cache_bytes"]) if config["cache_bytes"] else None
+        executor = DistributedExecutor(network, plan, local=not args.remote, cache=cache,
+                                       processes=config["processes"], memory_budget=config["memory_budget"])
+        try:
+            return asyncio.run(executor.collect(shards))
+        finally:
+            executor.close()
+            for discovery in list(network.discoveries):
+                network.remove_discovery(discovery)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        if args.trace:
+            tracing.export(args.trace)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="calcp2p node daemon and command line")
+    parser.add_argument("--config", type=str, help="YAML or JSON node configuration")
+    parser.add_argument("--timings", action="store_true", help="Print startup phase timings to stderr")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def common(sub: argparse.ArgumentParser):
+        sub.add_argument("--shards", type=str, nargs="+", help="CSV paths or glob patterns")
+        sub.add_argument("--peer", dest="peers", type=str, action="append", help="Static peer host:port")
+        sub.add_argument("--discovery", type=str, action="append", choices=sorted(DISCOVERY_BACKENDS))
+        sub.add_argument("--processes", type=int, help="Run on this many cores")
+        sub.add_argument("--memory-budget", dest="memory_budget", type=int, help="Bytes of group state")
+
+    serve_parser = commands.add_parser("serve", help="Run a worker node until interrupted")
+    common(serve_parser)
+    serve_parser.add_argument("--host", type=str)
+    serve_parser.add_argument("--port", type=int, help="0 picks a free port")
+    serve_parser.add_argument("--advertise", type=str, help="Address announced to discovery")
+
+    run_parser = commands.add_parser("run", help="Execute a plan and print its results")
+    common(run_parser)
+    run_parser.add_argument("plan", type=str)
+    run_parser.add_argument("--remote", action="store_true", help="Leave all shards to peers")
+    run_parser.add_argument("--discover", type=float, default=1.0,
+                            help="Seconds to wait for discovery before scheduling")
+    run_parser.add_argument("--trace", type=str, help="Write a Chrome trace of the run to this file")
+    run_parser.add_argument("--profile", type=float, help="Also sample stacks at this interval in seconds")
+    run_parser.add_argument("--output", type=str, help="JSON file to write, stdout if omitted")
+    run_parser.add_argument("--state", type=str, help="Keep partial states here and only read new or changed files")
+    args = parser.parse_args()
+    if getattr(args, "profile", None) and not args.trace:
+        parser.error("--profile needs --trace, the file its samples are written to")
+
+    timings = Timings()
+    with timings.phase("config"):
+        overrides = {
+            key: getattr(args, key, None)
+            for key in ("host", "port", "advertise", "discovery", "peers", "shards", "processes", "memory_budget",
+                        "state")
+        }
+        config = load_config(args.config, overrides)
+
+    if args.command == "serve":
+        serve(config, timings)
+        return
+
+    results = jsonable(run(config, args, timings))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Compute-engine benchmark over synthetic AIS data.
+
+    python -m command.bench --rows 10000 100000 1000000 --output bench.json
+
+For every scale, generates data with `synthetic.generate` and times each
+stage of the plan separately: ingest (read_csv of the columns the plan
+needs, which is also where select() prunes), every filter, and every
+query over the filtered rows, followed by the whole plan end to end
+through Executor. Each stage reports rows/sec over the input rows and
+the peak RSS reached while it ran.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Callable
+
+from .plan import Plan
+from .engine import Executor, Table, evaluate_mask, read_csv
+from .partials import merge_all
+from .synthetic import MODES, generate
+
+PLAN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "example.yml")
+
+
+def reset_peak_rss() -> bool:
+    """Restart the kernel's RSS high-water mark; Linux only."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # Lifetime peak, in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def measure(rows: int, fn: Callable[[], Any]) -> tuple[dict, Any]:
+    reset_peak_rss()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    return {
+        "seconds": elapsed,
+        "rows_per_s": rows / elapsed if elapsed else None,
+        "peak_rss_mb": peak_rss() / 2 ** 20,
+    }, result
+
+
+def bench_scale(plan: Plan, paths: list[str]) -> dict:
+    executor = Executor(plan)
+    ingest, tables = measure(0, lambda: [read_csv(path, executor.columns) for path in paths])
+    rows = sum(len(table) for table in tables)
+    ingest["rows_per_s"] = rows / ingest["seconds"] if ingest["seconds"] else None
+    stages = {"ingest": ingest}
+
+    masks = []
+    for op in plan.filters:
+        stats, mask = measure(rows, lambda: [evaluate_mask(op.expr, table) for table in tables])
+        stats["selectivity"] = sum(map(sum, mask)) / rows if rows else None
+        stages[op.name] = stats
+        masks.append(mask)
+
+    def apply() -> list[Table]:
+        if not masks:
+            return tables
+        return [
+            table.take([i for i, keep in enumerate(zip(*(mask[t] for mask in masks))) if all(keep)])
+            for t, table in enumerate(tables)
+        ]
+
+    stats, filtered = measure(rows, apply)
+    kept = sum(len(table) for table in filtered)
+    stats["selectivity"] = kept / rows if rows else None
+    stages["filter"] = stats
+
+    for name, query in executor.queries.items():
+        # Each query pays for its own derived data, e.g. the trajectory index
+        for table in filtered:
+            table._cache.clear()
+
+        def run():
+            partial = query.empty()
+            for table in filtered:
+                if len(table):
+                    shard = query.empty()
+                    query.update(shard, table)
+                    merge_all({name: partial}, {name: shard})
+            return query.finish(partial)
+
+        stages[name], _ = measure(rows, run)
+        stages[name]["filtered_rows"] = kept
+
+    del tables, filtered
+    stages["end_to_end"], _ = measure(rows, lambda: executor.finalize(Executor(plan).run(paths)))
+    return {"rows": rows, "files": len(paths), "stages": stages}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the compute engine on synthetic AIS data")
+    parser.add_argument("--plan", type=str, default=PLAN)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000], help="Scales to run")
+    parser.add_argument("--vessels", type=int, default=None, help="Vessel count, rows / 1000 if omitted")
+    parser.add_argument("--days", type=int, default=2)
+    parser.add_argument("--selectivity", type=float, default=0.5)
+    parser.add_argument("--mode", choices=MODES, default="tracks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data", type=str, help="Keep generated data under this directory")
+    parser.add_argument("--output", type=str, help="JSON file to write, stdout if omitted")
+    args = parser.parse_args()
+
+    plan = Plan.load(args.plan)
+    root = args.data or tempfile.mkdtemp(prefix="calcp2p-bench-")
+    results = {
+        "plan": os.path.abspath(args.plan),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.time(),
+        "peak_rss_per_stage": reset_peak_rss(),
+        "scales": [],
+    }
+    try:
+        for rows in args.rows:
+            vessels = args.vessels or max(1, rows // 1000)
+            directory = os.path.join(root, f"{rows}-{vessels}-{args.days}-{args.selectivity}-{args.mode}-{args.seed}")
+            paths = sorted(
+                os.path.join(directory, name) for name in os.listdir(directory)
+            ) if os.path.isdir(directory) else []
+            if not paths:
+                start = time.perf_counter()
+                paths = generate(directory, rows, vessels, args.days, args.selectivity, args.mode, args.seed)
+                print(f"Generated {rows} rows in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+            scale = bench_scale(plan, paths)
+            scale.update(vessels=vessels, days=args.days, selectivity=args.selectivity, mode=args.mode)
+            results["scales"].append(scale)
+            print(f"{rows} rows: {scale['stages']['end_to_end']['rows_per_s']:.0f} rows/s end to end",
+                  file=sys.stderr)
+    finally:
+        if args.data is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
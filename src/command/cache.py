@@ -0,0 +1,62 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from .plan import Plan, Operation
+
+
+def file_fingerprint(path: str) -> str:
+    """Identity of a shard by path, size and mtime, so peers on shared storage agree without reading it."""
+    stat = os.stat(path)
+    return f'{os.path.normpath(path)}:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def cache_key(plan: Plan, op: Operation, fingerprints: list[str]) -> str:
+    """Hash of the normalised operation, everything that shapes its input, and the data."""
+    spec = {
+        'operation': op.normalized,
+        'filters': sorted(f.normalized for f in plan.filters),
+        'approximate': plan.approximate,
+        'inputs': sorted(fingerprints),
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+class ResultCache:
+    """Size-bounded LRU of serialised partial states."""
+
+    def __init__(self, max_bytes: int = 64 << 20):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
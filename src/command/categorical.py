@@ -0,0 +1,51 @@
+from array import array
+from typing import Iterator
+
+
+class Categorical:
+    """
+    Dictionary-encoded string column: one small-int code per row plus the distinct values.
+
+    Codes start as 16-bit and widen to 32-bit if a column ever holds more
+    than 65536 distinct values. `codes` may also be a memoryview, e.g. over
+    shared memory.
+    """
+
+    def __init__(self, codes: array | memoryview | None = None, dictionary: list[str] | None = None):
+        self.codes = codes if codes is not None else array('H')
+        self.dictionary = dictionary if dictionary is not None else []
+        self.index = {value: code for code, value in enumerate(self.dictionary)}
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, i: int) -> str:
+        return self.dictionary[self.codes[i]]
+
+    def __iter__(self) -> Iterator[str]:
+        dictionary = self.dictionary
+        return (dictionary[code] for code in self.codes)
+
+    def code(self, value: str) -> int | None:
+        return self.index.get(value)
+
+    def append(self, value: str):
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.dictionary)
+            self.dictionary.append(value)
+            if code > 0xFFFF and self.codes.typecode == 'H':
+                self.codes = array('I', self.codes)
+        self.codes.append(code)
+
+    def take(self, rows: list[int]) -> 'Categorical':
+        codes = self.codes
+        return Categorical(array(codes.format if isinstance(codes, memoryview) else codes.typecode,
+                                 (codes[i] for i in rows)), self.dictionary)
+
+    def counts(self) -> dict[str, int]:
+        """Occurrences of each value, counted on the codes."""
+        tally = [0] * len(self.dictionary)
+        for code in self.codes:
+            tally[code] += 1
+        return {value: count for value, count in zip(self.dictionary, tally) if count}
@@ -0,0 +1,398 @@
+import asyncio
+import json
+import threading
+from typing import Any, Callable, Iterable
+from uuid import uuid4
+
+from .plan import Plan
+from .engine import Executor, expand
+from .partials import Partial, dump_partial, dump_partials, load_partial, load_partials, merge_all
+from .cache import ResultCache, cache_key, file_fingerprint
+from .scheduler import Attempt, SpeculativeScheduler
+from .tracing import TRACER, instant, now, record, span
+from net.node import DiscoverCallbackType
+
+PROTOCOL = "TCP"
+LOCAL = "local"
+
+
+def encode(message: dict) -> bytes:
+    return json.dumps(message).encode()
+
+
+def decode(data: bytes) -> dict:
+    return json.loads(data)
+
+
+def cache_keys(plan: Plan, shards: list[str]) -> dict[str, str]:
+    """Cache key of each query of `plan` over exactly these shards."""
+    fingerprints = [file_fingerprint(path) for path in shards]
+    queries = Executor(plan).queries
+    return {op.name: cache_key(plan, op, fingerprints) for op in plan.queries if op.name in queries}
+
+
+def cached_partials(cache: ResultCache, keys: dict[str, str]) -> dict[str, Partial]:
+    partials = {}
+    for name, key in keys.items():
+        value = cache.get(key)
+        if value is not None:
+            partials[name] = load_partial(decode(value))
+    return partials
+
+
+class Worker:
+    """
+    Serves plan execution requests arriving on a connection.
+
+    Use `worker.handle` as the `TCPServer` handler. Requests without an
+    explicit shard list run over the worker's own `shards`. With a `cache`,
+    results over explicit shard lists are kept and reused, and peers can
+    look them up; a coordinator on the same node should share it. With
+    `processes`, plans run on that many cores through a `ParallelExecutor`.
+    A `memory_budget` bounds the group state held while running.
+    """
+
+    def __init__(self, shards: Iterable[str] | None = None, cache: ResultCache | None = None,
+                 processes: int | None = None, memory_budget: int | None = None):
+        self.shards = list(shards or [])
+        self.cache = cache
+        self.processes = processes
+        self.memory_budget = memory_budget
+        # One process pool for every plan this worker runs
+        self._pool = None
+
+    async def handle(self, node, conn):
+        # Jobs run as tasks so the connection is still watched while they run;
+        # once the client hangs up they are cancelled at the next shard
+        jobs: dict[str, threading.Event] = {}
+        try:
+            while True:
+                data = await conn.read_message()
+                if data is None:
+                    return
+                request = decode(data)
+                if request.get("type") == "execute":
+                    job = request.get("job")
+                    jobs[job] = threading.Event()
+                    task = asyncio.ensure_future(self._respond(conn, request, jobs[job]))
+                    task.add_done_callback(lambda _, job=job: jobs.pop(job, None))
+                elif not await conn.write_message(encode(await self.dispatch(request))):
+                    return
+        finally:
+            for cancel in jobs.values():
+                cancel.set()
+
+    async def _respond(self, conn, request: dict, cancel: threading.Event):
+        job = request.get("job")
+        loop = asyncio.get_running_loop()
+
+        def progress(done: int, total: int):
+            message = encode({"type": "progress", "job": job, "done": done, "total": total})
+            asyncio.run_coroutine_threadsafe(conn.write_message(message), loop)
+
+        with TRACER.attach(request.get("trace")):
+            reply = await self.dispatch(request, progress, cancel)
+            if request.get("trace"):
+                reply["spans"] = TRACER.take(request["trace"]["trace_id"])
+        await conn.write_message(encode(reply))
+
+    async def dispatch(self, request: dict, progress: Callable[[int, int], None] | None = None,
+                       cancel: threading.Event | None = None) -> dict:
+        job = request.get("job")
+        if request.get("type") == "cache_get":
+            entries = {}
+            if self.cache is not None:
+                for key in request.get("keys", []):
+                    value = self.cache.get(key)
+                    if value is not None:
+                        entries[key] = decode(value)
+            return {"type": "cache_entries", "job": job, "entries": entries}
+
+        if request.get("type") != "execute":
+            return {"type": "error", "job": job, "error": f"Unknown request {request.get('type')}"}
+
+        try:
+            plan = Plan.from_dict(request["plan"])
+            shards = request.get("shards")
+            keys: dict[str, str] = {}
+            partials: dict[str, Partial] = {}
+            if shards is not None:
+                shards = expand(shards)
+                if self.cache is not None:
+                    keys = await asyncio.to_thread(cache_keys, plan, shards)
+                    partials = cached_partials(self.cache, keys)
+                    if len(partials) == len(keys):
+                        print(f"Worker answered plan {plan.id} from its cache")
+                        return {"type": "partials", "job": job, "partials": dump_partials(partials)}
+                    if partials:
+                        plan = plan.subset(name for name in keys if name not in partials)
+            else:
+                shards = self.shards
+            executor = self._executor(plan)
+
+            print(f"Worker running plan {plan.id} over {len(shards)} shards")
+            report = (lambda done: progress(done, len(shards))) if progress is not None else None
+            received = now()
+
+            def execute():
+                # Time spent waiting for a thread shows up as the gap before the first shard
+                record("queued", received, now(), cat="worker")
+                return executor.run(shards, report, cancel)
+
+            with span("execute", cat="worker", plan=plan.id, shards=len(shards), cached=len(partials)):
+                computed = await asyncio.to_thread(execute)
+        except Exception as e:
+            return {"type": "error", "job": job, "error": str(e)}
+        if cancel is not None and cancel.is_set():
+            return {"type": "cancelled", "job": job}
+        for name, partial in computed.items():
+            if name in keys:
+                self.cache.put(keys[name], encode(dump_partial(partial)))
+        partials.update(computed)
+        return {"type": "partials", "job": job, "partials": dump_partials(partials)}
+
+    def _executor(self, plan: Plan):
+        if self.processes:
+            # Imported here so single-process workers skip multiprocessing
+            from .parallel import ParallelExecutor, create_pool
+
+            if self._pool is None:
+                self._pool = create_pool(self.processes)
+            return ParallelExecutor(plan, self.processes, memory_budget=self.memory_budget, pool=self._pool)
+        return Executor(plan, self.memory_budget)
+
+
+class DistributedExecutor:
+    """
+    Map-reduce a plan across `Network.nodes`.
+
+    With an explicit shard list (storage every peer can read, e.g. DBFS) the
+    shards are split into contiguous runs between this host and its peers. Without one,
+    every node runs the plan over its own shards. Either way only partial
+    aggregates come back, and they are merged here.
+
+    Shared shards are cut into partitions of `partition_size` consecutive
+    files and scheduled by a `SpeculativeScheduler`: idle peers back up
+    straggling partitions, the first result wins, and partitions of peers
+    that the network removes are re-run elsewhere.
+
+    With a `cache`, every partition is first looked up by (operation, input
+    fingerprints) here and then on peers, whose workers cache the partitions
+    they run under the same keys. Only partitions with a miss are scheduled,
+    and their results are cached here.
+
+    `processes` and `memory_budget` apply to what runs on this host, as on
+    a `Worker`; call `close()` to stop its process pool.
+    """
+
+    def __init__(self, network, plan: Plan, local_shards: Iterable[str] | None = None, local: bool = True,
+                 cache: ResultCache | None = None, partition_size: int | None = None, speculation: float = 1.5,
+                 processes: int | None = None, memory_budget: int | None = None):
+        self.network = network
+        self.plan = plan
+        self.executor = Executor(plan, memory_budget)
+        self.local_shards = list(local_shards or [])
+        self.local = local
+        self.cache = cache
+        self.partition_size = partition_size
+        self.speculation = speculation
+        self.processes = processes
+        self.memory_budget = memory_budget
+        self._pool = None
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _local_executor(self, executor: Executor):
+        """What runs the local slot: `executor` itself, or a multi-core executor of its plan."""
+        if not self.processes:
+            return executor
+        # Imported here so single-process coordinators skip multiprocessing
+        from .parallel import ParallelExecutor, create_pool
+
+        if self._pool is None:
+            self._pool = create_pool(self.processes)
+        return ParallelExecutor(executor.plan, self.processes, memory_budget=self.memory_budget, pool=self._pool)
+
+    def peers(self) -> list:
+        return [
+            node for node in self.network.nodes.values()
+            if node.connection(PROTOCOL, outgoing=True) is not None
+        ]
+
+    async def run(self, shards: Iterable[str] | None = None) -> dict[str, Partial]:
+        with span("job", cat="distributed", plan=self.plan.id):
+            return await self._run(shards)
+
+    async def _run(self, shards: Iterable[str] | None) -> dict[str, Partial]:
+        return await self._compute(self.plan, self.executor, shards)
+
+    async def _lookup(self, keys: set[str]) -> dict[str, dict]:
+        with span("cache_lookup", cat="distributed", keys=len(keys)) as args:
+            found = await self._find(keys)
+            args["hits"] = len(found)
+        return found
+
+    async def _find(self, keys: set[str]) -> dict[str, dict]:
+        """Serialised partials by cache key, from this node's cache or else a peer's."""
+        found = {}
+        for key in keys:
+            value = self.cache.get(key)
+            if value is not None:
+                found[key] = decode(value)
+
+        wanted = [key for key in keys if key not in found]
+        if not wanted:
+            return found
+
+        replies = await asyncio.gather(
+            *(self._remote_lookup(node, wanted) for node in self.peers()),
+            return_exceptions=True,
+        )
+        for reply in replies:
+            if isinstance(reply, BaseException):
+                continue
+            for key, entry in reply.items():
+                if key in keys and key not in found:
+                    found[key] = entry
+                    self.cache.put(key, encode(entry))
+        return found
+
+    async def _remote_lookup(self, node, keys: list[str]) -> dict:
+        reply = await self._request(node, {"type": "cache_get", "job": str(uuid4()), "keys": keys})
+        return reply.get("entries", {})
+
+    async def _request(self, node, request: dict, on_progress: Callable[[int, int], None] | None = None) -> dict:
+        with span(request["type"], cat="net", node=str(node.id)):
+            conn = node.connection(PROTOCOL, outgoing=True)
+            with span("connect", cat="net", reused=conn.connected):
+                if not await conn.connect():
+                    raise ConnectionError(f"Node {node.id} is unreachable")
+
+            request = {**request, "trace": TRACER.context()}
+            data = encode(request)
+            with span("send", cat="net", bytes=len(data)):
+                if not await conn.write_message(data):
+                    raise ConnectionError(f"Failed to send request to node {node.id}")
+
+            with span("reply", cat="net") as args:
+                while True:
+                    data = await conn.read_message()
+                    if data is None:
+                        raise ConnectionError(f"Node {node.id} closed the connection")
+                    reply = decode(data)
+                    # Skip replies to jobs this side already gave up on
+                    if reply.get("job") != request["job"]:
+                        continue
+                    if reply.get("type") == "progress":
+                        if on_progress is not None:
+                            on_progress(reply["done"], reply["total"])
+                        continue
+                    args["bytes"] = len(data)
+                    TRACER.add(reply.pop("spans", []))
+                    return reply
+
+    async def _compute(self, plan: Plan, executor: Executor, shards: Iterable[str] | None) -> dict[str, Partial]:
+        slots = ([LOCAL] if self.local else []) + self.peers()
+        if not slots:
+            raise RuntimeError("No local executor and no peers to run on")
+
+        if shards is None:
+            results = await asyncio.gather(*(
+                self._run_local(executor, self.local_shards) if slot == LOCAL
+                else self._run_remote(plan, executor, slot, None)
+                for slot in slots
+            ))
+        else:
+            # Contiguous runs of time-ordered files, merged back in order, keep
+            # trajectory segments stitched across files
+            shards = sorted(expand(shards))
+            size = self.partition_size or max(1, len(shards) // (len(slots) * 4))
+            partitions = [shards[i:i + size] for i in range(0, len(shards), size)]
+            if self.cache is None:
+                results = await self._schedule(plan, executor, slots, partitions)
+            else:
+                results = await self._cached(plan, executor, slots, partitions)
+
+        partials = {name: query.empty() for name, query in executor.queries.items()}
+        for result in results:
+            merge_all(partials, result)
+            executor.enforce_budget(partials)
+        return partials
+
+    async def _cached(self, plan: Plan, executor: Executor, slots: list, partitions: list[list[str]]) -> list:
+        keys = await asyncio.to_thread(lambda: [cache_keys(plan, partition) for partition in partitions])
+        found = await self._lookup({key for partition in keys for key in partition.values()})
+
+        results: list = [None] * len(partitions)
+        missing = []
+        for p, partition in enumerate(keys):
+            if all(key in found for key in partition.values()):
+                results[p] = {name: load_partial(found[key]) for name, key in partition.items()}
+            else:
+                missing.append(p)
+        if missing:
+            computed = await self._schedule(plan, executor, slots, [partitions[p] for p in missing])
+            for p, partials in zip(missing, computed):
+                for name, partial in partials.items():
+                    self.cache.put(keys[p][name], encode(dump_partial(partial)))
+                results[p] = partials
+        return results
+
+    async def _schedule(self, plan: Plan, executor: Executor, slots: list, partitions: list[list[str]]) -> list:
+        async def launch(slot, partition: int, attempt: Attempt):
+            if slot == LOCAL:
+                return await self._run_local(executor, partitions[partition], attempt)
+            return await self._run_remote(plan, executor, slot, partitions[partition], attempt)
+
+        scheduler = SpeculativeScheduler(slots, launch, self.speculation)
+        loop = asyncio.get_running_loop()
+
+        # Discovery callbacks arrive on other threads
+        def on_remove(network, node):
+            instant("node_removed", cat="discovery", node=str(node.id))
+            loop.call_soon_threadsafe(scheduler.remove_slot, node)
+
+        def on_discover(network, node):
+            if node.connection(PROTOCOL, outgoing=True) is not None:
+                instant("node_discovered", cat="discovery", node=str(node.id))
+                loop.call_soon_threadsafe(scheduler.add_slot, node)
+
+        self.network.register_callback(DiscoverCallbackType.OnRemove, on_remove)
+        self.network.register_callback(DiscoverCallbackType.OnDiscover, on_discover)
+        try:
+            return await scheduler.run(len(partitions))
+        finally:
+            self.network.unregister_callback(DiscoverCallbackType.OnRemove, on_remove)
+            self.network.unregister_callback(DiscoverCallbackType.OnDiscover, on_discover)
+
+    async def collect(self, shards: Iterable[str] | None = None) -> dict[str, Any]:
+        with span("job", cat="distributed", plan=self.plan.id):
+            return self.executor.finalize(await self._run(shards))
+
+    async def _run_local(self, executor: Executor, shards: list[str],
+                         attempt: Attempt | None = None) -> dict[str, Partial]:
+        cancel = threading.Event()
+        report = (lambda done: attempt.report(done, len(shards))) if attempt is not None else None
+        local = self._local_executor(executor)
+        try:
+            return await asyncio.to_thread(local.run, shards, report, cancel)
+        except asyncio.CancelledError:
+            cancel.set()
+            raise
+
+    async def _run_remote(self, plan: Plan, executor: Executor, node, shards: list[str] | None,
+                          attempt: Attempt | None = None) -> dict[str, Partial]:
+        request = {"type": "execute", "job": str(uuid4()), "plan": plan.to_dict(), "shards": shards}
+        try:
+            reply = await self._request(node, request, attempt.report if attempt is not None else None)
+        except asyncio.CancelledError:
+            # Hanging up cancels the job on the worker and drops any half-read reply
+            await node.connection(PROTOCOL, outgoing=True).disconnect()
+            raise
+
+        if reply.get("type") != "partials":
+            raise RuntimeError(f"Node {node.id} failed: {reply.get('error')}")
+        return load_partials(reply["partials"])
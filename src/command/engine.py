@@ -0,0 +1,730 @@
+import ast
+import csv
+import glob
+import heapq
+import math
+import os
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from datetime import datetime
+from typing import Any, BinaryIO, Callable, Hashable, Iterable, Iterator
+
+from .plan import Plan, Operation, Column, Call
+from .partials import (
+    Partial, Mean, Moments, Frequencies, Distinct, Segments, Grouped, Columns,
+    SEGMENT_FUNCTIONS, merge_all,
+)
+from .sketches import HyperLogLog, KLL, HeavyHitters, TopSegments
+from .timestamps import MISSING_TIME, detect_format, iso_week
+from .categorical import Categorical
+from .spill import SpilledGrouped, estimate_bytes
+from .tracing import span
+
+
+# Mirrors the schema in spark.py; datetime columns are decoded to int64 epoch seconds
+SCHEMA: dict[str, type] = {
+    "# Timestamp": datetime,
+    "Type of mobile": str,
+    "MMSI": int,
+    "Latitude": float,
+    "Longitude": float,
+    "Navigational status": str,
+    "ROT": float,
+    "SOG": float,
+    "COG": float,
+    "Heading": float,
+    "IMO": str,
+    "Callsign": str,
+    "Name": str,
+    "Ship type": str,
+    "Cargo type": str,
+    "Width": float,
+    "Length": float,
+    "Type of position fixing device": str,
+    "Draught": str,
+    "Destination": str,
+    "ETA": datetime,
+    "Data source type": str,
+    "A": str,
+    "B": str,
+    "C": str,
+    "D": str,
+}
+
+TIMESTAMP = "# Timestamp"
+NUMERIC = (int, float, datetime)
+
+# Low-cardinality strings repeated on every row, stored as codes plus a dictionary
+CATEGORICAL = {
+    "Type of mobile",
+    "Navigational status",
+    "Ship type",
+    "Cargo type",
+    "Type of position fixing device",
+    "Destination",
+    "Data source type",
+}
+
+# Default target errors when a plan asks for `approximate: true`
+APPROXIMATE_ERRORS = {
+    'nunique': 0.01,    # relative error of HyperLogLog counts, at least HyperLogLog.MIN_ERROR (0.41%)
+    'quantiles': 0.01,  # rank error of KLL quantiles in describe()
+    'top': 0.001,       # Misra-Gries error as a fraction of the total weight
+}
+
+
+def resolve(name: str) -> str:
+    """Map plan column names to schema names, e.g. Timestamp -> '# Timestamp'."""
+    if name in SCHEMA:
+        return name
+    if f'# {name}' in SCHEMA:
+        return f'# {name}'
+    raise KeyError(f'Unknown column {name}')
+
+
+class TrajectoryIndex:
+    """
+    Rows sorted once by (key, timestamp) with the boundaries of each key.
+
+    Every consecutive-point operator walks `order[start:stop]` of a group
+    instead of re-grouping and re-sorting the table.
+    """
+
+    def __init__(self, keys: Iterable[Hashable], times: array):
+        keys = list(keys)
+        order = sorted(range(len(keys)), key=lambda i: (keys[i], times[i]))
+        self.order = array('q', order)
+        self.keys: list[Hashable] = []
+        self.offsets = array('q')
+        previous = object()
+        for position, i in enumerate(order):
+            if keys[i] != previous:
+                previous = keys[i]
+                self.keys.append(previous)
+                self.offsets.append(position)
+        self.offsets.append(len(order))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def groups(self) -> Iterator[tuple[Hashable, int, int]]:
+        offsets = self.offsets
+        for g, key in enumerate(self.keys):
+            yield key, offsets[g], offsets[g + 1]
+
+
+class Table:
+    """Columnar batch: numeric columns are typed arrays, strings are categoricals or lists."""
+
+    def __init__(self, columns: dict[str, array | Categorical | list]):
+        self.columns = columns
+        # Derived data shared by every query over this batch
+        self._cache: dict[Hashable, Any] = {}
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()), ()))
+
+    def column(self, name: str) -> array | Categorical | list:
+        return self.columns[resolve(name)]
+
+    def take(self, rows: list[int]) -> 'Table':
+        columns = {}
+        for name, values in self.columns.items():
+            if isinstance(values, array):
+                columns[name] = array(values.typecode, (values[i] for i in rows))
+            elif isinstance(values, Categorical):
+                columns[name] = values.take(rows)
+            else:
+                columns[name] = [values[i] for i in rows]
+        return Table(columns)
+
+    def timestamps(self) -> array:
+        return self.columns[TIMESTAMP]
+
+    def trajectories(self, key: str) -> TrajectoryIndex:
+        key = resolve(key)
+        index = self._cache.get(('trajectories', key))
+        if index is None:
+            index = self._cache[('trajectories', key)] = TrajectoryIndex(self.columns[key], self.timestamps())
+        return index
+
+
+def _empty_column(name: str) -> array | Categorical | list:
+    kind = SCHEMA[name]
+    if kind is int or kind is datetime:
+        return array('q')
+    if kind is float:
+        return array('d')
+    if name in CATEGORICAL:
+        return Categorical()
+    return []
+
+
+def byte_ranges(path: str, parts: int) -> list[tuple[int, int]]:
+    """Split a file into `parts` byte ranges for `read_csv`."""
+    size = os.path.getsize(path)
+    bounds = [size * i // parts for i in range(parts + 1)]
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:]) if stop > start]
+
+
+def _lines(f: BinaryIO, stop: int | None) -> Iterator[str]:
+    position = f.tell()
+    for line in f:
+        if stop is not None and position >= stop:
+            return
+        position += len(line)
+        yield line.decode()
+
+
+def read_csv(path: str, columns: Iterable[str] | None = None, start: int = 0, stop: int | None = None) -> Table:
+    """
+    Read the columns of `path` that the schema knows. With a byte range, only
+    rows whose line starts inside [start, stop) are read, so the ranges from
+    `byte_ranges` cover every row exactly once.
+    """
+    return next(read_chunks(path, columns, None, start, stop))
+
+
+def read_chunks(path: str, columns: Iterable[str] | None = None, rows: int | None = None,
+                start: int = 0, stop: int | None = None) -> Iterator[Table]:
+    """`read_csv` as tables of at most `rows` rows, and at least one table."""
+    with open(path, 'rb') as f:
+        first = f.readline()
+        header = next(csv.reader([first.decode()]), None) if first else None
+        if header is None:
+            yield Table({})
+            return
+        if start > f.tell():
+            # Skip the line straddling `start`; it belongs to the previous range
+            f.seek(start - 1)
+            f.readline()
+        reader = csv.reader(_lines(f, stop))
+
+        wanted = [name for name in header if name in SCHEMA and (columns is None or name in columns)]
+        index = [header.index(name) for name in wanted]
+        kinds = [SCHEMA[name] for name in wanted]
+        data = [_empty_column(name) for name in wanted]
+        count = chunks = 0
+        # Timestamp layouts are detected from the first value of each file
+        decoders = {}
+
+        for row in reader:
+            values = []
+            for i, kind in zip(index, kinds):
+                raw = row[i] if i < len(row) else ''
+                if kind is datetime:
+                    decoder = decoders.get(i)
+                    if decoder is None and raw:
+                        decoder = decoders[i] = detect_format([raw])
+                    value = decoder.decode(raw) if decoder is not None else None
+                    if value is None:
+                        if header[i] == TIMESTAMP:
+                            break
+                        value = MISSING_TIME
+                    values.append(value)
+                elif kind is float:
+                    try:
+                        values.append(float(raw))
+                    except ValueError:
+                        values.append(math.nan)
+                elif kind is int:
+                    try:
+                        values.append(int(raw))
+                    except ValueError:
+                        break
+                else:
+                    values.append(raw)
+            else:
+                for column, value in zip(data, values):
+                    column.append(value)
+                count += 1
+                if count == rows:
+                    yield Table(dict(zip(wanted, data)))
+                    data = [_empty_column(name) for name in wanted]
+                    count = 0
+                    chunks += 1
+
+        if count or not chunks:
+            yield Table(dict(zip(wanted, data)))
+
+
+def expand(patterns: Iterable[str]) -> list[str]:
+    shards = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        shards.extend(matches if matches else [pattern])
+    return shards
+
+
+COLUMN_TYPES = (array, Categorical, list, memoryview)
+
+_COMPARE = {
+    ast.Gt: lambda a, b: a > b,
+    ast.GtE: lambda a, b: a >= b,
+    ast.Lt: lambda a, b: a < b,
+    ast.LtE: lambda a, b: a <= b,
+    ast.Eq: lambda a, b: a == b,
+    ast.NotEq: lambda a, b: a != b,
+}
+
+
+def _categorical_mask(column: Categorical, op: ast.cmpop, value: Any) -> list[bool] | None:
+    """Equality against a constant, decided on the codes."""
+    if not isinstance(op, (ast.Eq, ast.NotEq)):
+        return None
+    code = column.code(value)
+    if isinstance(op, ast.Eq):
+        return [c == code for c in column.codes]
+    return [c != code for c in column.codes]
+
+
+def evaluate_mask(expr: ast.AST, table: Table) -> list[bool]:
+    n = len(table)
+    if isinstance(expr, ast.BoolOp):
+        masks = [evaluate_mask(value, table) for value in expr.values]
+        if isinstance(expr.op, ast.And):
+            return [all(values) for values in zip(*masks)]
+        return [any(values) for values in zip(*masks)]
+
+    if isinstance(expr, ast.Compare):
+        mask = [True] * n
+        left = expr.left
+        for op, right in zip(expr.ops, expr.comparators):
+            compare = _COMPARE[type(op)]
+            a, b = _operand(left, table), _operand(right, table)
+            if isinstance(a, Categorical) and not isinstance(b, COLUMN_TYPES):
+                codes = _categorical_mask(a, op, b)
+                if codes is not None:
+                    mask = [m and c for m, c in zip(mask, codes)]
+                    left = right
+                    continue
+            elif isinstance(b, Categorical) and not isinstance(a, COLUMN_TYPES):
+                codes = _categorical_mask(b, op, a)
+                if codes is not None:
+                    mask = [m and c for m, c in zip(mask, codes)]
+                    left = right
+                    continue
+            if isinstance(a, COLUMN_TYPES) and isinstance(b, COLUMN_TYPES):
+                mask = [m and compare(x, y) for m, x, y in zip(mask, a, b)]
+            elif isinstance(a, COLUMN_TYPES):
+                mask = [m and compare(x, b) for m, x in zip(mask, a)]
+            else:
+                mask = [m and compare(a, y) for m, y in zip(mask, b)]
+            left = right
+        return mask
+
+    raise ValueError(f'Unsupported filter expression: {ast.dump(expr)}')
+
+
+def _operand(node: ast.AST, table: Table) -> Any:
+    if isinstance(node, ast.Name):
+        return table.column(node.id)
+    if _is_col(node):
+        return table.column(node.args[0].value)
+    if isinstance(node, ast.Constant):
+        return node.value
+    raise ValueError(f'Unsupported operand: {ast.dump(node)}')
+
+
+def _is_col(node: ast.AST) -> bool:
+    """col("Ship type") names a column that is not a valid identifier."""
+    return (
+        isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'col'
+        and len(node.args) == 1 and isinstance(node.args[0], ast.Constant)
+    )
+
+
+def _filter_columns(expr: ast.AST) -> set[str]:
+    columns = set()
+    for node in ast.walk(expr):
+        if _is_col(node):
+            columns.add(resolve(node.args[0].value))
+        elif isinstance(node, ast.Name) and node.id != 'col':
+            columns.add(resolve(node.id))
+    return columns
+
+
+def key_values(table: Table, key: Column | Call) -> list[Hashable]:
+    if isinstance(key, Column):
+        return list(table.column(key.name))
+    if isinstance(key, Call) and key.name == 'week':
+        return [iso_week(t) for t in key_values(table, key.args[0])]
+    raise ValueError(f'Unsupported group key {key}')
+
+
+def group_by(table: Table, key: Column | Call) -> dict[Hashable, list[int]]:
+    """Rows per key; categorical keys are grouped on their codes."""
+    if isinstance(key, Column):
+        column = table.column(key.name)
+        if isinstance(column, Categorical):
+            dictionary = column.dictionary
+            return {dictionary[code]: rows for code, rows in group_rows(column.codes).items()}
+    return group_rows(key_values(table, key))
+
+
+def group_rows(keys: list[Hashable]) -> dict[Hashable, list[int]]:
+    groups: dict[Hashable, list[int]] = {}
+    for i, key in enumerate(keys):
+        rows = groups.get(key)
+        if rows is None:
+            groups[key] = [i]
+        else:
+            rows.append(i)
+    return groups
+
+
+def _key_columns(key: Column | Call) -> set[str]:
+    if isinstance(key, Column):
+        return {resolve(key.name)}
+    return set().union(*(_key_columns(arg) for arg in key.args))
+
+
+class Query(ABC):
+    def __init__(self, name: str, approximate: dict[str, float] | None = None):
+        self.name = name
+        self.approximate = approximate
+
+    @property
+    @abstractmethod
+    def columns(self) -> set[str]:
+        pass
+
+    @abstractmethod
+    def empty(self) -> Partial:
+        pass
+
+    @abstractmethod
+    def update(self, partial: Partial, table: Table):
+        pass
+
+    def finish(self, partial: Partial) -> Any:
+        return partial.result()
+
+
+class GroupedSegments(Query):
+    """groupby(K).map(fn(...)).mean() and groupby(K).sum(fn(...)).top(n)."""
+
+    def __init__(self, name: str, key: Column | Call, function: Call, reduce: str, top: int | None = None,
+                 approximate: dict[str, float] | None = None):
+        super().__init__(name, approximate)
+        if function.name not in SEGMENT_FUNCTIONS:
+            raise ValueError(f'Unknown function {function.name} in {name}')
+        self.key = key
+        self.function = function
+        self.reduce = reduce
+        self.top = top
+
+    @property
+    def columns(self) -> set[str]:
+        return _key_columns(self.key) | {TIMESTAMP} | {resolve(arg.name) for arg in self.function.args}
+
+    @property
+    def sketched(self) -> bool:
+        return self.approximate is not None and self.top is not None
+
+    def empty(self) -> Grouped | TopSegments:
+        if self.sketched:
+            return TopSegments.for_error(self.approximate['top'])
+        return Grouped()
+
+    def _columns(self, table: Table) -> list:
+        times = table.timestamps()
+        if self.function.name == 'diff':
+            return [times]
+        return [times] + [table.column(arg.name) for arg in self.function.args]
+
+    def update(self, partial: Grouped | TopSegments, table: Table):
+        columns = self._columns(table)
+        groups = Grouped() if self.sketched else partial
+
+        if isinstance(self.key, Column):
+            index = table.trajectories(self.key.name)
+            order = index.order
+            for key, start, stop in index.groups():
+                points = [tuple(column[i] for column in columns) for i in order[start:stop]]
+                groups.get(key, lambda: Segments(self.function.name)).extend(points)
+        else:
+            points = list(zip(*columns))
+            for key, rows in group_by(table, self.key).items():
+                ordered = sorted((points[i] for i in rows), key=lambda point: point[0])
+                groups.get(key, lambda: Segments(self.function.name)).extend(ordered)
+        if self.sketched:
+            partial.add_batch(groups.groups)
+
+    def finish(self, partial: Grouped | SpilledGrouped | TopSegments) -> Any:
+        if self.sketched:
+            return partial.top(self.top)
+        if isinstance(partial, SpilledGrouped):
+            parts = [self.finish(grouped) for grouped in partial.partitions()]
+            if self.top is None:
+                return {key: value for part in parts for key, value in part.items()}
+            return heapq.nlargest(self.top, (item for part in parts for item in part), key=lambda item: item[1])
+        results = {key: segments.result()[self.reduce] for key, segments in partial.groups.items()}
+        if self.top is None:
+            return results
+        return heapq.nlargest(self.top, results.items(), key=lambda item: item[1])
+
+
+class GroupedAggregate(Query):
+    """groupby(K).mean(col) and groupby(K).nunique(col)."""
+
+    PARTIALS = {'mean': Mean, 'nunique': Distinct}
+
+    def __init__(self, name: str, key: Column | Call, aggregate: str, column: Column,
+                 approximate: dict[str, float] | None = None):
+        super().__init__(name, approximate)
+        self.key = key
+        self.aggregate = aggregate
+        self.column = column
+
+    @property
+    def columns(self) -> set[str]:
+        return _key_columns(self.key) | {resolve(self.column.name)}
+
+    def empty(self) -> Grouped:
+        return Grouped()
+
+    def update(self, partial: Grouped, table: Table):
+        factory = self.PARTIALS[self.aggregate]
+        if self.aggregate == 'nunique' and self.approximate is not None:
+            factory = lambda: HyperLogLog.for_error(self.approximate['nunique'])
+        values = table.column(self.column.name)
+        skip_nan = self.aggregate == 'mean'
+        for key, rows in group_by(table, self.key).items():
+            aggregate = partial.get(key, factory)
+            if isinstance(values, Categorical):
+                # Distinct codes first, so each value is decoded once per group
+                codes = values.codes
+                for code in {codes[i] for i in rows}:
+                    aggregate.add(values.dictionary[code])
+                continue
+            for i in rows:
+                value = values[i]
+                if skip_nan and value != value:
+                    continue
+                aggregate.add(value)
+
+
+class Describe(Query):
+    def __init__(self, name: str, columns: list[Column], approximate: dict[str, float] | None = None):
+        super().__init__(name, approximate)
+        self.names = [resolve(column.name) for column in columns]
+
+    @property
+    def columns(self) -> set[str]:
+        return set(self.names)
+
+    def empty(self) -> Columns:
+        return Columns()
+
+    def _summary(self, name: str) -> Partial:
+        numeric = SCHEMA[name] in NUMERIC
+        if self.approximate is None:
+            return Moments() if numeric else Frequencies()
+        if numeric:
+            return Columns({
+                'moments': Moments(),
+                'quantiles': KLL.for_error(self.approximate['quantiles']),
+            })
+        return Columns({
+            'frequencies': HeavyHitters.for_error(self.approximate['top']),
+            'unique': HyperLogLog.for_error(self.approximate['nunique']),
+        })
+
+    def update(self, partial: Columns, table: Table):
+        for name in self.names:
+            values = table.columns[name]
+            summary = partial.columns.get(name)
+            if summary is None:
+                summary = partial.columns[name] = self._summary(name)
+            parts = list(summary.columns.values()) if isinstance(summary, Columns) else [summary]
+            if isinstance(values, Categorical):
+                counts = values.counts()
+                for part in parts:
+                    for value, count in counts.items():
+                        if isinstance(part, HyperLogLog):
+                            part.add(value)
+                        else:
+                            part.add(value, count)
+                continue
+            for part in parts:
+                for value in values:
+                    if value == value and value != MISSING_TIME:
+                        part.add(value)
+
+    def finish(self, partial: Columns) -> dict:
+        results = {}
+        for name, summary in partial.columns.items():
+            if isinstance(summary, Columns):
+                flat = {}
+                for part, result in summary.result().items():
+                    if isinstance(result, dict):
+                        flat.update(result)
+                    else:
+                        flat[part] = result
+                results[name] = flat
+            else:
+                results[name] = summary.result()
+        return results
+
+
+def compile_query(op: Operation, approximate: dict[str, float] | None = None) -> Query:
+    chain = op.chain
+    names = [call.name for call in chain]
+
+    if names == ['describe']:
+        return Describe(op.name, chain[0].args[0], approximate)
+
+    if names[:1] == ['groupby'] and len(chain) >= 2:
+        key = chain[0].args[0]
+        step = chain[1]
+        if names[1:] == ['map', 'mean']:
+            return GroupedSegments(op.name, key, step.args[0], 'mean', approximate=approximate)
+        if names[1] == 'sum' and isinstance(step.args[0], Call):
+            top = chain[2].args[0] if names[2:] == ['top'] else None
+            if len(chain) > 2 and top is None:
+                raise ValueError(f'Unsupported operation {op.name}: {op.source}')
+            return GroupedSegments(op.name, key, step.args[0], 'sum', top, approximate)
+        if names[1:] in (['mean'], ['nunique']):
+            return GroupedAggregate(op.name, key, names[1], step.args[0], approximate)
+
+    raise ValueError(f'Unsupported operation {op.name}: {op.source}')
+
+
+class Executor:
+    """
+    Runs the filters, selection and queries of a plan over local CSV shards.
+
+    With a `memory_budget` (bytes), shards are read `chunk_rows` rows at a
+    time, and grouped state that outgrows the budget after a chunk is
+    hash-partitioned and spilled to temp files under `spill_dir`, then merged
+    back one partition at a time when results are finished.
+    """
+
+    def __init__(self, plan: Plan, memory_budget: int | None = None, spill_dir: str | None = None,
+                 chunk_rows: int = 1 << 16):
+        self.plan = plan
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.chunk_rows = chunk_rows
+        self.filters = [op.expr for op in plan.filters]
+        self.selection: list[str] | None = None
+        self.queries: dict[str, Query] = {}
+
+        approximate = None
+        if plan.approximate is not None:
+            approximate = {**APPROXIMATE_ERRORS, **plan.approximate}
+            # Groups build their sketches lazily, so an unreachable target is rejected here
+            HyperLogLog.for_error(approximate['nunique'])
+
+        for op in plan.queries:
+            chain = op.chain
+            if [call.name for call in chain] == ['select']:
+                self.selection = [resolve(column.name) for column in chain[0].args]
+            else:
+                self.queries[op.name] = compile_query(op, approximate)
+
+    @property
+    def columns(self) -> set[str]:
+        needed = set().union(*(_filter_columns(expr) for expr in self.filters))
+        if self.selection is not None:
+            needed.update(self.selection)
+        for query in self.queries.values():
+            needed |= query.columns
+        return needed
+
+    def load(self, path: str, start: int = 0, stop: int | None = None) -> Table:
+        with span('read_csv', path=path) as args:
+            table = read_csv(path, self.columns, start, stop)
+            args['rows'] = len(table)
+        return self._filter(table)
+
+    def _filter(self, table: Table) -> Table:
+        if not self.filters or not len(table):
+            return table
+        with span('filter', rows=len(table)) as args:
+            masks = [evaluate_mask(expr, table) for expr in self.filters]
+            table = table.take([i for i, keep in enumerate(zip(*masks)) if all(keep)])
+            args['kept'] = len(table)
+        return table
+
+    def run_table(self, table: Table) -> dict[str, Partial]:
+        partials = {}
+        for name, query in self.queries.items():
+            with span(name, cat='operator', rows=len(table)):
+                partial = query.empty()
+                if len(table):
+                    query.update(partial, table)
+            partials[name] = partial
+        return partials
+
+    def run(self, shards: Iterable[str], progress: Callable[[int], None] | None = None,
+            cancel: threading.Event | None = None) -> dict[str, Partial]:
+        """Merge the partials of every shard; `progress` gets the count done, `cancel` stops between shards."""
+        partials: dict[str, Partial] = {name: query.empty() for name, query in self.queries.items()}
+        for done, path in enumerate(shards, 1):
+            if cancel is not None and cancel.is_set():
+                break
+            with span('shard', path=path):
+                if self.memory_budget is None:
+                    merge_all(partials, self.run_table(self.load(path)))
+                else:
+                    self._run_chunks(partials, path)
+            if progress is not None:
+                progress(done)
+        return partials
+
+    def _run_chunks(self, partials: dict[str, Partial], path: str):
+        """Fold one shard in chunks, spilling as soon as its state and the merged state outgrow the budget."""
+        shard = None
+        for table in read_chunks(path, self.columns, self.chunk_rows):
+            table = self._filter(table)
+            if shard is None:
+                shard = {name: query.empty() for name, query in self.queries.items()}
+            for name, query in self.queries.items():
+                if len(table):
+                    # Consecutive chunks extend the shard's trajectories rather than adding runs
+                    query.update(shard[name], table)
+            if sum(self._sizes(partials).values()) + sum(self._sizes(shard).values()) > self.memory_budget:
+                merge_all(partials, shard)
+                shard = None
+                self.enforce_budget(partials)
+        if shard is not None:
+            merge_all(partials, shard)
+            self.enforce_budget(partials)
+
+    @staticmethod
+    def _sizes(partials: dict[str, Partial]) -> dict[str, int]:
+        sizes = {}
+        for name, partial in partials.items():
+            if isinstance(partial, SpilledGrouped):
+                sizes[name] = estimate_bytes(partial.memory)
+            elif isinstance(partial, Grouped):
+                sizes[name] = estimate_bytes(partial)
+        return sizes
+
+    def enforce_budget(self, partials: dict[str, Partial]):
+        """Spill the largest in-memory group states until the rest fit the budget."""
+        if self.memory_budget is None:
+            return
+        sizes = self._sizes(partials)
+        total = sum(sizes.values())
+        for name in sorted(sizes, key=sizes.get, reverse=True):
+            if total <= self.memory_budget:
+                break
+            partial = partials[name]
+            if not isinstance(partial, SpilledGrouped):
+                spilled = partials[name] = SpilledGrouped(directory=self.spill_dir)
+                spilled.spill(partial)
+            else:
+                partial.spill()
+            print(f'Spilled {sizes[name]} bytes of {name} group state to disk')
+            total -= sizes[name]
+
+    def finalize(self, partials: dict[str, Partial]) -> dict[str, Any]:
+        results = {}
+        for name, partial in partials.items():
+            with span(f'{name}.finish', cat='operator'):
+                results[name] = self.queries[name].finish(partial)
+        return results
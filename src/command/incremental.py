@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+from typing import Iterable
+
+from .plan import Plan
+from .engine import Executor, expand
+from .partials import Partial, dump_partials, load_partials, merge_all
+from .cache import file_fingerprint
+
+
+class StateStore:
+    """
+    Partial states on disk, one file per (plan, input file).
+
+    Layout: <directory>/<plan digest>/files/<path hash>.json holds the state
+    of a single input file and <directory>/<plan digest>/total.json holds the
+    merge of every file it lists.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _plan_dir(self, plan: Plan) -> str:
+        return os.path.join(self.directory, plan.digest())
+
+    def _file_path(self, plan: Plan, path: str) -> str:
+        name = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+        return os.path.join(self._plan_dir(plan), 'files', f'{name}.json')
+
+    def _read(self, path: str) -> dict | None:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write(self, path: str, data: dict):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def load_file(self, plan: Plan, path: str, fp: str) -> dict[str, Partial] | None:
+        data = self._read(self._file_path(plan, path))
+        if data is None or data['fingerprint'] != fp:
+            return None
+        return load_partials(data['partials'])
+
+    def save_file(self, plan: Plan, path: str, fp: str, partials: dict[str, Partial]):
+        self._write(self._file_path(plan, path), {
+            'path': path,
+            'fingerprint': fp,
+            'partials': dump_partials(partials),
+        })
+
+    def load_total(self, plan: Plan) -> tuple[dict[str, str], dict[str, Partial]] | None:
+        data = self._read(os.path.join(self._plan_dir(plan), 'total.json'))
+        if data is None:
+            return None
+        return data['files'], load_partials(data['partials'])
+
+    def save_total(self, plan: Plan, files: dict[str, str], partials: dict[str, Partial]):
+        self._write(os.path.join(self._plan_dir(plan), 'total.json'), {
+            'files': files,
+            'partials': dump_partials(partials),
+        })
+
+
+class IncrementalExecutor:
+    """
+    Re-evaluates a plan touching only input files that are new or changed.
+
+    Files are merged in path order, which for daily AIS files is time order,
+    so trajectory segments are stitched across days. New files that sort after
+    everything already merged are folded into the stored total; anything else
+    (changed, removed or back-filled files) rebuilds the total from the stored
+    per-file states, still without re-reading unchanged CSVs.
+
+    `store` is a StateStore or the directory of one.
+    """
+
+    def __init__(self, plan: Plan, store: StateStore | str, memory_budget: int | None = None):
+        self.plan = plan
+        self.store = StateStore(store) if isinstance(store, str) else store
+        self.executor = Executor(plan, memory_budget)
+
+    def _file_partials(self, path: str, fp: str) -> dict[str, Partial]:
+        partials = self.store.load_file(self.plan, path, fp)
+        if partials is None:
+            print(f'Processing new or changed file {path}')
+            partials = self.executor.run([path])
+            self.store.save_file(self.plan, path, fp, partials)
+        return partials
+
+    def run(self, shards: Iterable[str] | None = None) -> dict[str, Partial]:
+        paths = sorted(expand(shards if shards is not None else self.plan.data))
+        files = {path: file_fingerprint(path) for path in paths}
+
+        stored = self.store.load_total(self.plan)
+        if stored is not None:
+            merged_files, partials = stored
+            unchanged = all(files.get(path) == fp for path, fp in merged_files.items())
+            new = [path for path in paths if path not in merged_files]
+            if unchanged and all(path > max(merged_files, default='') for path in new):
+                if not new:
+                    return partials
+                for path in new:
+                    merge_all(partials, self._file_partials(path, files[path]))
+                self.store.save_total(self.plan, files, partials)
+                return partials
+
+        partials = {name: query.empty() for name, query in self.executor.queries.items()}
+        for path in paths:
+            merge_all(partials, self._file_partials(path, files[path]))
+        self.store.save_total(self.plan, files, partials)
+        return partials
+
+    def finalize(self, partials: dict[str, Partial]) -> dict:
+        return self.executor.finalize(partials)
+
+    def collect(self, shards: Iterable[str] | None = None) -> dict:
+        return self.finalize(self.run(shards))
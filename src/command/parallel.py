@@ -0,0 +1,274 @@
+import json
+import multiprocessing
+import os
+import threading
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Iterable
+
+from .plan import Plan
+from .engine import Executor, Table, byte_ranges
+from .categorical import Categorical
+from .partials import Partial, merge_all
+from .tracing import span
+
+PARTITION_KEY = "MMSI"
+# Shards are only split into byte ranges this large or larger
+MIN_RANGE_BYTES = 4 << 20
+# Executors kept per pool worker, for the plans it ran most recently
+PLANS_PER_WORKER = 8
+
+# A shared batch as sent to workers: block name, column layout, partition bounds, list columns
+Block = tuple[str, list[tuple[str, str, int, list[str] | None]], list[tuple[int, int]], dict[str, list]]
+
+_executors: OrderedDict[str, Executor] = OrderedDict()
+
+
+def _executor(plan: str) -> Executor:
+    executor = _executors.get(plan)
+    if executor is None:
+        executor = _executors[plan] = Executor(Plan.from_dict(json.loads(plan)))
+        if len(_executors) > PLANS_PER_WORKER:
+            _executors.popitem(last=False)
+    _executors.move_to_end(plan)
+    return executor
+
+
+def _map(plan: str, path: str, start: int, stop: int, partitions: int) -> Block | None:
+    """Read and filter one byte range of a shard into a shared batch partitioned by MMSI."""
+    table = _executor(plan).load(path, start, stop)
+    if not len(table):
+        return None
+    batch = SharedBatch(table, partitions)
+    # The parent unlinks the block once every partition has been reduced
+    batch.shm.close()
+    return batch.shm.name, batch.layout, batch.bounds, batch.lists
+
+
+def _reduce(plan: str, blocks: list[Block], partition: int) -> dict[str, Partial]:
+    """Run the plan's queries over one partition of every block of a shard."""
+    shms = []
+    views = []
+    try:
+        parts = []
+        for name, layout, bounds, lists in blocks:
+            start, stop = bounds[partition]
+            if stop == start:
+                continue
+            # Pool workers share the parent's resource tracker, which unlinks the block
+            shm = SharedMemory(name)
+            shms.append(shm)
+            columns = {column: values[start:stop] for column, values in lists.items()}
+            for column, typecode, offset, dictionary in layout:
+                itemsize = array(typecode).itemsize
+                view = shm.buf[offset + start * itemsize:offset + stop * itemsize].cast(typecode)
+                views.append(view)
+                columns[column] = view if dictionary is None else Categorical(view, dictionary)
+            parts.append(columns)
+        if not parts:
+            return {name: query.empty() for name, query in _executor(plan).queries.items()}
+        # A single block is viewed in place; several are concatenated into one table,
+        # so each trajectory of the shard is seen whole
+        return _executor(plan).run_table(Table(parts[0] if len(parts) == 1 else concat(parts)))
+    finally:
+        for view in views:
+            view.release()
+        for shm in shms:
+            shm.close()
+
+
+def concat(parts: list[dict]) -> dict:
+    columns = {}
+    for name in parts[0]:
+        values = [part[name] for part in parts]
+        if isinstance(values[0], Categorical):
+            # Each block has its own dictionary, so codes are translated to a merged one
+            index: dict[str, int] = {}
+            for column in values:
+                for value in column.dictionary:
+                    index.setdefault(value, len(index))
+            codes = array('H' if len(index) <= 0x10000 else 'I')
+            for column in values:
+                translate = [index[value] for value in column.dictionary]
+                codes.extend(translate[code] for code in column.codes)
+            columns[name] = Categorical(codes, list(index))
+        elif isinstance(values[0], memoryview):
+            column = array(values[0].format)
+            for view in values:
+                column.extend(view)
+            columns[name] = column
+        else:
+            columns[name] = [value for column in values for value in column]
+    return columns
+
+
+def _unlink(name: str):
+    shm = SharedMemory(name)
+    shm.close()
+    shm.unlink()
+
+
+class SharedBatch:
+    """
+    A filtered table laid out in one shared memory block, rows grouped by partition.
+
+    Numeric columns and categorical codes are copied in once and then viewed
+    by workers without pickling; dictionaries and the remaining string
+    columns travel with the task.
+    """
+
+    def __init__(self, table: Table, partitions: int):
+        n = len(table)
+        keys = table.columns.get(PARTITION_KEY)
+        if keys is not None:
+            buckets = [[] for _ in range(partitions)]
+            for i, key in enumerate(keys):
+                # MMSIs are ints, which hash the same in every process
+                buckets[hash(key) % partitions].append(i)
+        else:
+            size = -(-n // partitions)
+            buckets = [list(range(start, min(n, start + size))) for start in range(0, n, size)]
+            buckets += [[] for _ in range(partitions - len(buckets))]
+        order = [i for bucket in buckets for i in bucket]
+
+        self.bounds = []
+        start = 0
+        for bucket in buckets:
+            self.bounds.append((start, start + len(bucket)))
+            start += len(bucket)
+
+        self.layout: list[tuple[str, str, int, list[str] | None]] = []
+        self.lists: dict[str, list] = {}
+        arrays = {}
+        offset = 0
+        for name, values in table.columns.items():
+            dictionary = None
+            if isinstance(values, Categorical):
+                values, dictionary = values.codes, values.dictionary
+            if isinstance(values, array):
+                arrays[name] = array(values.typecode, (values[i] for i in order))
+                self.layout.append((name, values.typecode, offset, dictionary))
+                offset += -(-n * values.itemsize // 8) * 8
+            else:
+                self.lists[name] = [values[i] for i in order]
+
+        self.shm = SharedMemory(create=True, size=max(offset, 1))
+        for name, typecode, offset, _ in self.layout:
+            column = arrays[name]
+            view = self.shm.buf[offset:offset + n * column.itemsize].cast(typecode)
+            view[:] = column
+            view.release()
+
+
+def create_pool(processes: int) -> ProcessPoolExecutor:
+    """Worker processes started from a fork server, which is safe from a multi-threaded daemon."""
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context(method))
+
+
+class ParallelExecutor:
+    """
+    Runs a plan on every core of one node.
+
+    Pool workers read and filter byte ranges of each shard themselves and
+    hash-partition the rows by MMSI into a shared memory block. Then one
+    task per partition views that partition of every block of the shard in
+    place, so every trajectory is seen whole by one worker, and the parent
+    merges the partials. Up to `in_flight` shards are in progress at once.
+
+    The pool is started on first use and kept until `close()`; pass `pool`
+    to share one between executors, e.g. one per plan on a daemon.
+    """
+
+    def __init__(self, plan: Plan, processes: int | None = None, in_flight: int = 2,
+                 memory_budget: int | None = None, pool: ProcessPoolExecutor | None = None):
+        self.plan = plan
+        self.executor = Executor(plan, memory_budget)
+        self.processes = processes or os.cpu_count() or 1
+        self.in_flight = in_flight
+        self._pool = pool
+        self._owns_pool = pool is None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = create_pool(self.processes)
+        return self._pool
+
+    def close(self):
+        if self._owns_pool and self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self) -> 'ParallelExecutor':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def run(self, shards: Iterable[str], progress: Callable[[int], None] | None = None,
+            cancel: threading.Event | None = None) -> dict[str, Partial]:
+        partials = {name: query.empty() for name, query in self.executor.queries.items()}
+        plan = json.dumps(self.plan.to_dict())
+        # Shards in progress, oldest first: [map futures, blocks, reduce futures or None]
+        pending: deque[list] = deque()
+        done = 0
+
+        def advance():
+            """Start reducing the oldest shard once it is mapped, or merge it once it is reduced."""
+            nonlocal done
+            stage = pending[0]
+            maps, _, reduces = stage
+            if reduces is None:
+                with span('map', cat='parallel', ranges=len(maps)):
+                    stage[1] = blocks = [block for block in (future.result() for future in maps) if block]
+                stage[2] = [self.pool.submit(_reduce, plan, blocks, p) for p in range(self.processes) if blocks]
+                return
+
+            pending.popleft()
+            try:
+                shard = {name: query.empty() for name, query in self.executor.queries.items()}
+                with span('reduce', cat='parallel', partitions=len(reduces)):
+                    for future in reduces:
+                        merge_all(shard, future.result())
+                merge_all(partials, shard)
+                self.executor.enforce_budget(partials)
+                done += 1
+                if progress is not None:
+                    progress(done)
+            finally:
+                for name, *_ in stage[1]:
+                    _unlink(name)
+
+        try:
+            for path in shards:
+                if cancel is not None and cancel.is_set():
+                    break
+                parts = max(1, min(self.processes, os.path.getsize(path) // MIN_RANGE_BYTES))
+                maps = [self.pool.submit(_map, plan, path, start, stop, self.processes)
+                        for start, stop in byte_ranges(path, parts)]
+                pending.append([maps, [], None])
+                while len(pending) >= self.in_flight:
+                    advance()
+            while pending and not (cancel is not None and cancel.is_set()):
+                advance()
+        finally:
+            # Blocks of abandoned shards are unlinked once their tasks are over
+            for maps, blocks, reduces in pending:
+                futures = maps + (reduces or [])
+                for future in futures:
+                    future.cancel()
+                wait(futures)
+                if reduces is None:
+                    blocks = [
+                        future.result() for future in maps
+                        if not future.cancelled() and future.exception() is None and future.result()
+                    ]
+                for name, *_ in blocks:
+                    _unlink(name)
+        return partials
+
+    def finalize(self, partials: dict[str, Partial]) -> dict:
+        return self.executor.finalize(partials)
@@ -0,0 +1,370 @@
+import math
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Hashable
+
+
+class Partial(ABC):
+    """A mergeable partial aggregate. Only these ever cross the network."""
+
+    kind: str = ''
+
+    @abstractmethod
+    def merge(self, other: 'Partial') -> None:
+        pass
+
+    @abstractmethod
+    def result(self) -> Any:
+        pass
+
+    @abstractmethod
+    def to_state(self) -> Any:
+        pass
+
+    @classmethod
+    @abstractmethod
+    def from_state(cls, state: Any) -> 'Partial':
+        pass
+
+
+PARTIALS: dict[str, type[Partial]] = {}
+
+
+def register(cls: type[Partial]) -> type[Partial]:
+    PARTIALS[cls.kind] = cls
+    return cls
+
+
+def dump_partial(partial: Partial) -> dict:
+    return {'kind': partial.kind, 'state': partial.to_state()}
+
+
+def load_partial(data: dict) -> Partial:
+    return PARTIALS[data['kind']].from_state(data['state'])
+
+
+def dump_partials(partials: dict[str, Partial]) -> dict:
+    return {name: dump_partial(partial) for name, partial in partials.items()}
+
+
+def load_partials(data: dict) -> dict[str, Partial]:
+    return {name: load_partial(partial) for name, partial in data.items()}
+
+
+@register
+class Mean(Partial):
+    kind = 'mean'
+
+    def __init__(self, total: float = 0.0, count: int = 0):
+        self.total = total
+        self.count = count
+
+    def add(self, value: float):
+        self.total += value
+        self.count += 1
+
+    def merge(self, other: 'Mean'):
+        self.total += other.total
+        self.count += other.count
+
+    def result(self) -> float | None:
+        return self.total / self.count if self.count else None
+
+    def to_state(self) -> list:
+        return [self.total, self.count]
+
+    @classmethod
+    def from_state(cls, state: list) -> 'Mean':
+        return cls(*state)
+
+
+@register
+class Moments(Partial):
+    """Count, mean, variance, min and max, merged with Chan's parallel formula."""
+
+    kind = 'moments'
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0,
+                 min: float = math.inf, max: float = -math.inf):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = min
+        self.max = max
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'Moments'):
+        if not other.count:
+            return
+        if not self.count:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def result(self) -> dict:
+        if not self.count:
+            return {'count': 0}
+        std = math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+        return {'count': self.count, 'mean': self.mean, 'std': std, 'min': self.min, 'max': self.max}
+
+    def to_state(self) -> list:
+        return [self.count, self.mean, self.m2, self.min, self.max]
+
+    @classmethod
+    def from_state(cls, state: list) -> 'Moments':
+        return cls(*state)
+
+
+@register
+class Frequencies(Partial):
+    """Value counts, used to describe low-cardinality string columns."""
+
+    kind = 'frequencies'
+
+    def __init__(self, counts: dict[Hashable, int] | None = None):
+        self.counts = counts or {}
+
+    def add(self, value: Hashable, count: int = 1):
+        self.counts[value] = self.counts.get(value, 0) + count
+
+    def merge(self, other: 'Frequencies'):
+        for value, count in other.counts.items():
+            self.counts[value] = self.counts.get(value, 0) + count
+
+    def result(self) -> dict:
+        if not self.counts:
+            return {'count': 0}
+        top = max(self.counts, key=self.counts.get)
+        return {
+            'count': sum(self.counts.values()),
+            'unique': len(self.counts),
+            'top': top,
+            'freq': self.counts[top],
+        }
+
+    def to_state(self) -> list:
+        return list(self.counts.items())
+
+    @classmethod
+    def from_state(cls, state: list) -> 'Frequencies':
+        return cls({value: count for value, count in state})
+
+
+@register
+class Distinct(Partial):
+    kind = 'distinct'
+
+    def __init__(self, values: set | None = None):
+        self.values = values or set()
+
+    def add(self, value: Hashable):
+        self.values.add(value)
+
+    def merge(self, other: 'Distinct'):
+        self.values |= other.values
+
+    def result(self) -> int:
+        return len(self.values)
+
+    def to_state(self) -> list:
+        return list(self.values)
+
+    @classmethod
+    def from_state(cls, state: list) -> 'Distinct':
+        return cls(set(state))
+
+
+def haversine(a: tuple, b: tuple) -> float:
+    """Great-circle distance in km between two (t, lat, lon) points."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[1], a[2], b[1], b[2]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 \
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(min(1.0, h)))
+
+
+def diff(a: tuple, b: tuple) -> float:
+    return b[0] - a[0]
+
+
+SEGMENT_FUNCTIONS: dict[str, Callable[[tuple, tuple], float]] = {
+    'haversine': haversine,
+    'diff': diff,
+}
+
+
+@register
+class Segments(Partial):
+    """
+    Sum and count of a function over consecutive points of one trajectory.
+
+    Points are tuples starting with the timestamp. The partial is a list of
+    time-disjoint runs, each [first point, last point, total, count], so the
+    segments bridging runs (e.g. two daily files) are only added once the
+    result is read and do not depend on the order partials were merged in.
+    Overlapping runs are summed as is.
+    """
+
+    kind = 'segments'
+
+    def __init__(self, function: str, runs: list[list] | None = None):
+        self.function = function
+        # Sorted by the timestamp of their first point
+        self.runs = runs or []
+
+    def extend(self, points: list[tuple]):
+        """Add points sorted by timestamp, continuing the last run if they all come after it."""
+        if not points:
+            return
+        if self.runs and points[0][0] < self.runs[-1][1][0]:
+            run = Segments(self.function)
+            run.extend(points)
+            self.merge(run)
+            return
+        fn = SEGMENT_FUNCTIONS[self.function]
+        if not self.runs:
+            self.runs.append([points[0], None, 0.0, 0])
+        run = self.runs[-1]
+        prev, total, count = run[1], run[2], run[3]
+        for point in points:
+            if prev is not None:
+                total += fn(prev, point)
+                count += 1
+            prev = point
+        run[1], run[2], run[3] = prev, total, count
+
+    def merge(self, other: 'Segments'):
+        if not other.runs:
+            return
+        runs = [list(run) for run in other.runs]
+        if self.runs and runs[0][0][0] >= self.runs[-1][1][0]:
+            # The usual case of merging shards in time order
+            self.runs.extend(runs)
+            return
+        runs = sorted(self.runs + runs, key=lambda run: run[0][0])
+        merged = [runs[0]]
+        for run in runs[1:]:
+            current = merged[-1]
+            if run[0][0] < current[1][0]:
+                current[2] += run[2]
+                current[3] += run[3]
+                if run[1][0] > current[1][0]:
+                    current[1] = run[1]
+            else:
+                merged.append(run)
+        self.runs = merged
+
+    @property
+    def total(self) -> float:
+        fn = SEGMENT_FUNCTIONS[self.function]
+        bridges = sum(fn(a[1], b[0]) for a, b in zip(self.runs, self.runs[1:]))
+        return sum(run[2] for run in self.runs) + bridges
+
+    @property
+    def count(self) -> int:
+        return sum(run[3] for run in self.runs) + max(len(self.runs) - 1, 0)
+
+    def result(self) -> dict:
+        total, count = self.total, self.count
+        return {'sum': total, 'mean': total / count if count else None}
+
+    def to_state(self) -> list:
+        return [self.function, self.runs]
+
+    @classmethod
+    def from_state(cls, state: list) -> 'Segments':
+        function, runs = state
+        return cls(function, [[tuple(first), tuple(last), total, count] for first, last, total, count in runs])
+
+
+@register
+class Grouped(Partial):
+    kind = 'grouped'
+
+    def __init__(self, groups: dict[Hashable, Partial] | None = None):
+        self.groups = groups or {}
+
+    def get(self, key: Hashable, factory: Callable[[], Partial]) -> Partial:
+        partial = self.groups.get(key)
+        if partial is None:
+            partial = self.groups[key] = factory()
+        return partial
+
+    def merge(self, other: 'Grouped'):
+        for key, partial in other.groups.items():
+            mine = self.groups.get(key)
+            if mine is None:
+                self.groups[key] = partial
+            else:
+                mine.merge(partial)
+
+    def result(self) -> dict:
+        return {key: partial.result() for key, partial in self.groups.items()}
+
+    def to_state(self) -> list:
+        return [[key, dump_partial(partial)] for key, partial in self.groups.items()]
+
+    @classmethod
+    def from_state(cls, state: list) -> 'Grouped':
+        return cls({json_key(key): load_partial(partial) for key, partial in state})
+
+
+@register
+class Columns(Partial):
+    """One partial per column, as produced by describe()."""
+
+    kind = 'columns'
+
+    def __init__(self, columns: dict[str, Partial] | None = None):
+        self.columns = columns or {}
+
+    def merge(self, other: 'Columns'):
+        for name, partial in other.columns.items():
+            mine = self.columns.get(name)
+            if mine is None:
+                self.columns[name] = partial
+            else:
+                mine.merge(partial)
+
+    def result(self) -> dict:
+        return {name: partial.result() for name, partial in self.columns.items()}
+
+    def to_state(self) -> list:
+        return [[name, dump_partial(partial)] for name, partial in self.columns.items()]
+
+    @classmethod
+    def from_state(cls, state: list) -> 'Columns':
+        return cls({name: load_partial(partial) for name, partial in state})
+
+
+def merge_all(target: dict[str, Partial], source: dict[str, Partial]) -> dict[str, Partial]:
+    for name, partial in source.items():
+        mine = target.get(name)
+        if mine is None:
+            target[name] = partial
+        elif isinstance(mine, Grouped) and not isinstance(partial, Grouped):
+            # A spilled source takes in the in-memory groups rather than loading its own
+            partial.merge(mine)
+            target[name] = partial
+        else:
+            mine.merge(partial)
+    return target
+
+
+def json_key(key: Any) -> Hashable:
+    # JSON turns tuple keys into lists
+    return tuple(key) if isinstance(key, list) else key
@@ -0,0 +1,153 @@
+import ast
+import hashlib
+import json
+from typing import Any, Iterable
+
+
+class Column:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self) -> str:
+        return f'Column({self.name!r})'
+
+
+class Call:
+    def __init__(self, name: str, args: list[Any]):
+        self.name = name
+        self.args = args
+
+    def __repr__(self) -> str:
+        return f'Call({self.name!r}, {self.args!r})'
+
+
+class Operation:
+    """A single line of a plan: either `Name = expr` or `Name: expr`."""
+
+    def __init__(self, name: str, source: str, expr: Any, assignment: bool):
+        self.name = name
+        self.source = source
+        self.expr = expr
+        self.assignment = assignment
+
+    @property
+    def is_filter(self) -> bool:
+        return self.assignment and isinstance(self.expr, (ast.BoolOp, ast.Compare))
+
+    @property
+    def normalized(self) -> str:
+        """Canonical text of the operation, insensitive to spacing and quoting."""
+        return f'{self.name}{" =" if self.assignment else ":"} {ast.unparse(self.expr)}'
+
+    @property
+    def chain(self) -> list[Call]:
+        """Flatten `a(..).b(..).c(..)` into [a, b, c]."""
+        calls: list[Call] = []
+        node = self.expr
+        while isinstance(node, ast.Call):
+            func = node.func
+            if isinstance(func, ast.Attribute):
+                calls.append(Call(func.attr, [_convert(arg) for arg in node.args]))
+                node = func.value
+            elif isinstance(func, ast.Name):
+                calls.append(Call(func.id, [_convert(arg) for arg in node.args]))
+                node = None
+            else:
+                raise ValueError(f'Unsupported call in {self.name}: {self.source}')
+        if node is not None:
+            raise ValueError(f'Operation {self.name} is not a call chain: {self.source}')
+        return list(reversed(calls))
+
+
+class Plan:
+    def __init__(self, id: str, operations: list[Operation], data: list[str] | None = None,
+                 approximate: dict[str, float] | None = None):
+        self.id = id
+        self.operations = operations
+        self.data = data or []
+        # Target errors per sketch kind; None runs everything exactly
+        self.approximate = approximate
+
+    @property
+    def filters(self) -> list[Operation]:
+        return [op for op in self.operations if op.is_filter]
+
+    @property
+    def queries(self) -> list[Operation]:
+        return [op for op in self.operations if not op.assignment]
+
+    @classmethod
+    def load(cls, path: str) -> 'Plan':
+        # Workers get plans as JSON and never need the YAML parser
+        import yaml
+
+        with open(path) as f:
+            return cls.from_dict(yaml.safe_load(f))
+
+    @classmethod
+    def from_dict(cls, spec: dict) -> 'Plan':
+        operations = [parse_operation(line) for line in spec.get('operations') or []]
+        approximate = spec.get('approximate')
+        if approximate is True:
+            approximate = {}
+        elif approximate is False:
+            approximate = None
+        return cls(str(spec.get('id', '')), operations, list(spec.get('data') or []), approximate)
+
+    def subset(self, names: Iterable[str]) -> 'Plan':
+        """The same plan restricted to the named queries; filters and selections are kept."""
+        names = set(names)
+        operations = [
+            op for op in self.operations
+            if op.assignment or op.name in names or [call.name for call in op.chain] == ['select']
+        ]
+        return Plan(self.id, operations, self.data, self.approximate)
+
+    def digest(self) -> str:
+        """Identifies what the plan computes; `id` and `data` do not take part."""
+        spec = {
+            'operations': [op.normalized for op in self.operations],
+            'approximate': self.approximate,
+        }
+        return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'operations': [op.source for op in self.operations],
+            'data': list(self.data),
+            'approximate': self.approximate,
+        }
+
+
+def parse_operation(line: str | dict) -> Operation:
+    if isinstance(line, dict):
+        # YAML reads `Name: expr` entries as single-key mappings
+        (name, expr), = line.items()
+        line = f'{name}: {expr}'
+
+    eq = line.find('=')
+    colon = line.find(':')
+    # `Name = a >= b` vs `Name: expr`, whichever separator comes first
+    if eq != -1 and (colon == -1 or eq < colon) and line[eq + 1:eq + 2] != '=':
+        name, expr, assignment = line[:eq], line[eq + 1:], True
+    elif colon != -1:
+        name, expr, assignment = line[:colon], line[colon + 1:], False
+    else:
+        raise ValueError(f'Cannot parse operation: {line}')
+
+    tree = ast.parse(expr.strip(), mode='eval')
+    return Operation(name.strip(), line, tree.body, assignment)
+
+
+def _convert(node: ast.AST) -> Any:
+    if isinstance(node, ast.Name):
+        return Column(node.id)
+    if isinstance(node, ast.Constant):
+        # Quoted names are columns too, e.g. groupby("Ship type")
+        return Column(node.value) if isinstance(node.value, str) else node.value
+    if isinstance(node, ast.List):
+        return [_convert(elt) for elt in node.elts]
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+        return Call(node.func.id, [_convert(arg) for arg in node.args])
+    raise ValueError(f'Unsupported argument: {ast.dump(node)}')
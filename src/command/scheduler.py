@@ -0,0 +1,155 @@
+import asyncio
+import statistics
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable
+
+from .tracing import instant, span
+
+
+class Attempt:
+    """One run of a partition on a slot, with the progress it has reported."""
+
+    def __init__(self, partition: int, slot: Hashable, backup: bool = False):
+        self.partition = partition
+        self.slot = slot
+        self.backup = backup
+        self.started = time.monotonic()
+        self.done = 0
+        self.total = 0
+
+    def report(self, done: int, total: int):
+        self.done = done
+        self.total = total
+
+    def expected(self, now: float) -> float:
+        """Projected total duration from the progress reported so far."""
+        elapsed = now - self.started
+        if self.done and self.total:
+            return elapsed * self.total / self.done
+        return elapsed
+
+
+Launch = Callable[[Hashable, int, Attempt], Awaitable[Any]]
+
+
+class SpeculativeScheduler:
+    """
+    Runs partitions on a changing set of slots and backs up stragglers.
+
+    Each idle slot takes the next pending partition. Once nothing is pending,
+    idle slots start a backup of the running partition projected to finish
+    last, if it is `speculation` times slower than the median partition so
+    far. The first result wins and the other attempt is cancelled. Attempts
+    on slots that are removed or fail are re-queued.
+    """
+
+    def __init__(self, slots: list[Hashable], launch: Launch, speculation: float = 1.5,
+                 min_wait: float = 1.0, poll: float = 0.25, max_failures: int = 3):
+        self.slots = list(slots)
+        self.launch = launch
+        self.speculation = speculation
+        self.min_wait = min_wait
+        self.poll = poll
+        self.max_failures = max_failures
+        self._idle: deque[Hashable] = deque(self.slots)
+        self._attempts: dict[asyncio.Task, Attempt] = {}
+
+    def add_slot(self, slot: Hashable):
+        if slot not in self.slots:
+            self.slots.append(slot)
+            self._idle.append(slot)
+
+    def remove_slot(self, slot: Hashable):
+        if slot not in self.slots:
+            return
+        self.slots.remove(slot)
+        if slot in self._idle:
+            self._idle.remove(slot)
+        for task, attempt in self._attempts.items():
+            if attempt.slot == slot:
+                task.cancel()
+
+    def _start(self, slot: Hashable, partition: int, backup: bool = False):
+        attempt = Attempt(partition, slot, backup)
+        task = asyncio.ensure_future(self._attempt(attempt))
+        self._attempts[task] = attempt
+        if backup:
+            print(f"Speculatively re-running partition {partition} on {slot}")
+
+    async def _attempt(self, attempt: Attempt) -> Any:
+        with span('attempt', cat='scheduler', partition=attempt.partition, slot=str(attempt.slot),
+                  backup=attempt.backup):
+            return await self.launch(attempt.slot, attempt.partition, attempt)
+
+    def _straggler(self, durations: list[float]) -> int | None:
+        if not durations:
+            return None
+        now = time.monotonic()
+        threshold = max(self.min_wait, self.speculation * statistics.median(durations))
+        running: dict[int, list[Attempt]] = {}
+        for attempt in self._attempts.values():
+            running.setdefault(attempt.partition, []).append(attempt)
+
+        candidates = [
+            (attempts[0].expected(now), partition) for partition, attempts in running.items()
+            if len(attempts) == 1 and now - attempts[0].started > self.min_wait
+            and attempts[0].expected(now) > threshold
+        ]
+        return max(candidates)[1] if candidates else None
+
+    async def run(self, count: int) -> list[Any]:
+        results: list[Any] = [None] * count
+        finished = [False] * count
+        failures = [0] * count
+        durations: list[float] = []
+        pending = deque(range(count))
+
+        try:
+            while not all(finished):
+                while self._idle and pending:
+                    self._start(self._idle.popleft(), pending.popleft())
+                if self._idle and not pending:
+                    partition = self._straggler(durations)
+                    if partition is not None:
+                        self._start(self._idle.popleft(), partition, backup=True)
+
+                if not self._attempts:
+                    if not self.slots:
+                        raise RuntimeError("No slots left to run partitions on")
+                    await asyncio.sleep(self.poll)
+                    continue
+
+                done, _ = await asyncio.wait(self._attempts, timeout=self.poll,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    attempt = self._attempts.pop(task)
+                    p = attempt.partition
+
+                    if not task.cancelled() and task.exception() is None:
+                        if not finished[p]:
+                            results[p] = task.result()
+                            finished[p] = True
+                            durations.append(time.monotonic() - attempt.started)
+                            for other, running in self._attempts.items():
+                                if running.partition == p:
+                                    other.cancel()
+                    elif not task.cancelled():
+                        failures[p] += 1
+                        print(f"Partition {p} failed on {attempt.slot}: {task.exception()}")
+                        if isinstance(task.exception(), ConnectionError):
+                            self.remove_slot(attempt.slot)
+                        if failures[p] >= self.max_failures:
+                            raise RuntimeError(f"Partition {p} failed {failures[p]} times") from task.exception()
+
+                    still_running = any(a.partition == p for a in self._attempts.values())
+                    if not finished[p] and not still_running and p not in pending:
+                        instant('requeue', cat='scheduler', partition=p, slot=str(attempt.slot))
+                        pending.appendleft(p)
+                    if attempt.slot in self.slots and attempt.slot not in self._idle:
+                        self._idle.append(attempt.slot)
+        finally:
+            for task in self._attempts:
+                task.cancel()
+            self._attempts.clear()
+        return results
@@ -0,0 +1,265 @@
+import base64
+import hashlib
+import math
+import random
+from typing import Hashable
+
+from .partials import Partial, Segments, register, json_key
+
+
+def stable_hash(value: Hashable) -> int:
+    """64-bit hash that is identical on every peer, unlike hash() on str."""
+    return int.from_bytes(hashlib.blake2b(repr(value).encode(), digest_size=8).digest(), 'big')
+
+
+@register
+class HyperLogLog(Partial):
+    """Distinct count with relative standard error of about 1.04 / sqrt(2 ** precision)."""
+
+    kind = 'hll'
+    MAX_PRECISION = 16
+    # The smallest relative error for_error() can promise, about 0.41%
+    MIN_ERROR = 1.04 / math.sqrt(2 ** MAX_PRECISION)
+
+    def __init__(self, precision: int = 12, registers: bytearray | None = None):
+        self.precision = precision
+        self.registers = registers if registers is not None else bytearray(1 << precision)
+
+    @classmethod
+    def for_error(cls, error: float) -> 'HyperLogLog':
+        if error < cls.MIN_ERROR:
+            raise ValueError(f'HyperLogLog cannot meet a relative error below {cls.MIN_ERROR:.4f}, got {error}')
+        precision = math.ceil(math.log2((1.04 / error) ** 2))
+        return cls(min(cls.MAX_PRECISION, max(4, precision)))
+
+    def add(self, value: Hashable):
+        h = stable_hash(value)
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog'):
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge HyperLogLog sketches of different precision')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def result(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def to_state(self) -> list:
+        return [self.precision, base64.b64encode(self.registers).decode()]
+
+    @classmethod
+    def from_state(cls, state: list) -> 'HyperLogLog':
+        precision, registers = state
+        return cls(precision, bytearray(base64.b64decode(registers)))
+
+
+@register
+class KLL(Partial):
+    """KLL quantile sketch; normalised rank error is roughly 2.3 / k ** 0.97."""
+
+    kind = 'kll'
+    QUANTILES = (0.25, 0.5, 0.75)
+
+    def __init__(self, k: int = 200, levels: list[list[float]] | None = None, count: int = 0):
+        self.k = k
+        self.levels = levels or [[]]
+        self.count = count
+
+    @classmethod
+    def for_error(cls, error: float) -> 'KLL':
+        return cls(max(8, math.ceil((2.296 / error) ** (1 / 0.9723))))
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(self.k * (2 / 3) ** depth))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                items.sort()
+                # An odd item out stays behind so weights are preserved
+                keep = [items.pop()] if len(items) % 2 else []
+                self.levels[level + 1].extend(items[random.getrandbits(1)::2])
+                self.levels[level] = keep
+            level += 1
+
+    def add(self, value: float):
+        self.levels[0].append(value)
+        self.count += 1
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def merge(self, other: 'KLL'):
+        self.k = max(self.k, other.k)
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for mine, theirs in zip(self.levels, other.levels):
+            mine.extend(theirs)
+        self.count += other.count
+        self._compress()
+
+    def quantile(self, q: float) -> float | None:
+        weighted = sorted((value, 1 << level) for level, items in enumerate(self.levels) for value in items)
+        if not weighted:
+            return None
+        total = sum(weight for _, weight in weighted)
+        target = q * total
+        seen = 0
+        for value, weight in weighted:
+            seen += weight
+            if seen >= target:
+                return value
+        return weighted[-1][0]
+
+    def result(self) -> dict:
+        return {f'{round(q * 100)}%': self.quantile(q) for q in self.QUANTILES}
+
+    def to_state(self) -> list:
+        return [self.k, self.levels, self.count]
+
+    @classmethod
+    def from_state(cls, state: list) -> 'KLL':
+        return cls(*state)
+
+
+@register
+class HeavyHitters(Partial):
+    """
+    Weighted Misra-Gries summary with `capacity` counters.
+
+    Estimates undercount by at most total weight / (capacity + 1), and the
+    bound survives merging.
+    """
+
+    kind = 'heavy_hitters'
+
+    def __init__(self, capacity: int = 1000, counters: dict[Hashable, float] | None = None, total: float = 0.0):
+        self.capacity = capacity
+        self.counters = counters or {}
+        self.total = total
+
+    @classmethod
+    def for_error(cls, error: float) -> 'HeavyHitters':
+        return cls(math.ceil(1 / error))
+
+    def add(self, key: Hashable, weight: float = 1):
+        self.total += weight
+        self.counters[key] = self.counters.get(key, 0) + weight
+        if len(self.counters) > self.capacity:
+            self._shrink(min(self.counters.values()))
+
+    def _shrink(self, amount: float):
+        self.counters = {key: count - amount for key, count in self.counters.items() if count > amount}
+
+    def merge(self, other: 'HeavyHitters'):
+        self.capacity = max(self.capacity, other.capacity)
+        self.total += other.total
+        for key, count in other.counters.items():
+            self.counters[key] = self.counters.get(key, 0) + count
+        if len(self.counters) > self.capacity:
+            counts = sorted(self.counters.values(), reverse=True)
+            self._shrink(counts[self.capacity])
+
+    def top(self, n: int) -> list[tuple[Hashable, float]]:
+        return sorted(self.counters.items(), key=lambda item: item[1], reverse=True)[:n]
+
+    def result(self) -> dict:
+        if not self.counters:
+            return {'count': self.total}
+        (top, freq), = self.top(1)
+        return {'count': self.total, 'top': top, 'freq': freq}
+
+    def to_state(self) -> list:
+        return [self.capacity, list(self.counters.items()), self.total]
+
+    @classmethod
+    def from_state(cls, state: list) -> 'HeavyHitters':
+        capacity, counters, total = state
+        return cls(capacity, {key: count for key, count in counters}, total)
+
+
+@register
+class TopSegments(Partial):
+    """
+    Heavy hitters over the segment sums of trajectories, for top(n).
+
+    Each batch adds its per-key sums to a Misra-Gries summary and keeps the
+    first and last point of the key's run, for the keys the summary still
+    counts. The segments joining runs are added in `top()`, whatever order
+    batches were merged in, so with more counters than keys the result is
+    exact. A key that is evicted loses the joining segments seen so far.
+    """
+
+    kind = 'top_segments'
+
+    def __init__(self, counts: HeavyHitters, ends: dict[Hashable, Segments] | None = None):
+        self.counts = counts
+        # Runs without totals; their result is the sum of the joining segments
+        self.ends = ends or {}
+
+    @classmethod
+    def for_error(cls, error: float) -> 'TopSegments':
+        return cls(HeavyHitters.for_error(error))
+
+    def add_batch(self, groups: dict[Hashable, Segments]):
+        for key, segments in groups.items():
+            self.counts.add(key, segments.total)
+            ends = Segments(segments.function, [[first, last, 0.0, 0] for first, last, _, _ in segments.runs])
+            mine = self.ends.get(key)
+            if mine is None:
+                self.ends[key] = ends
+            else:
+                mine.merge(ends)
+        self._prune()
+
+    def _prune(self):
+        counters = self.counts.counters
+        self.ends = {key: ends for key, ends in self.ends.items() if key in counters}
+
+    def merge(self, other: 'TopSegments'):
+        self.counts.merge(other.counts)
+        for key, ends in other.ends.items():
+            mine = self.ends.get(key)
+            if mine is None:
+                self.ends[key] = ends
+            else:
+                mine.merge(ends)
+        self._prune()
+
+    def top(self, n: int) -> list[tuple[Hashable, float]]:
+        estimates = {
+            key: count + (self.ends[key].total if key in self.ends else 0.0)
+            for key, count in self.counts.counters.items()
+        }
+        return sorted(estimates.items(), key=lambda item: item[1], reverse=True)[:n]
+
+    def result(self) -> dict:
+        if not self.counts.counters:
+            return {'count': self.counts.total}
+        (top, freq), = self.top(1)
+        return {'count': self.counts.total, 'top': top, 'freq': freq}
+
+    def to_state(self) -> list:
+        return [self.counts.to_state(), [[key, ends.to_state()] for key, ends in self.ends.items()]]
+
+    @classmethod
+    def from_state(cls, state: list) -> 'TopSegments':
+        counts, ends = state
+        return cls(
+            HeavyHitters.from_state(counts),
+            {json_key(key): Segments.from_state(value) for key, value in ends},
+        )
@@ -0,0 +1,115 @@
+import json
+import os
+import shutil
+import tempfile
+import weakref
+from itertools import islice
+from typing import Iterator
+
+from .partials import Partial, Grouped, dump_partial, load_partial, json_key
+from .sketches import stable_hash
+
+SAMPLE_GROUPS = 16
+# Python objects take a few times their JSON size in memory
+OBJECT_OVERHEAD = 3
+
+
+def estimate_bytes(grouped: Grouped) -> int:
+    """Rough in-memory size of a Grouped partial, from a sample of its groups."""
+    n = len(grouped.groups)
+    if not n:
+        return 0
+    sample = [[key, dump_partial(partial)] for key, partial in islice(grouped.groups.items(), SAMPLE_GROUPS)]
+    return len(json.dumps(sample)) * OBJECT_OVERHEAD * n // len(sample)
+
+
+class SpilledGrouped(Partial):
+    """
+    A Grouped partial whose groups are partly hash-partitioned into temp files.
+
+    Every spill appends one run to each partition file, so runs of a key are
+    merged in the order they were produced. Consumers walk `partitions()` and
+    only ever hold one partition's groups in memory. On the wire it is sent
+    as a plain Grouped.
+    """
+
+    kind = Grouped.kind
+
+    def __init__(self, partitions: int = 16, directory: str | None = None):
+        self.directory = tempfile.mkdtemp(prefix='calcp2p-spill-', dir=directory)
+        self.paths = [os.path.join(self.directory, f'{i}.jsonl') for i in range(partitions)]
+        self.memory = Grouped()
+        self.spills = 0
+        weakref.finalize(self, shutil.rmtree, self.directory, True)
+
+    def spill(self, grouped: Grouped | None = None):
+        grouped = grouped if grouped is not None else self.memory
+        files = [open(path, 'a') for path in self.paths]
+        try:
+            for key, partial in grouped.groups.items():
+                line = json.dumps([key, dump_partial(partial)])
+                files[stable_hash(key) % len(files)].write(line + '\n')
+        finally:
+            for f in files:
+                f.close()
+        grouped.groups.clear()
+        self.spills += 1
+
+    def merge(self, other: Partial):
+        if isinstance(other, SpilledGrouped):
+            # Its spilled runs are appended as they are and its in-memory groups merged once;
+            # going through other.partitions() would fold those groups in twice
+            for path in other.paths:
+                if os.path.exists(path):
+                    self._append_runs(path)
+            self.memory.merge(other.memory)
+        else:
+            self.memory.merge(other)
+
+    def _append_runs(self, path: str):
+        files = [open(mine, 'a') for mine in self.paths]
+        try:
+            with open(path) as f:
+                for line in f:
+                    key = json_key(json.loads(line)[0])
+                    files[stable_hash(key) % len(files)].write(line)
+        finally:
+            for f in files:
+                f.close()
+
+    def partitions(self) -> Iterator[Grouped]:
+        """Each partition fully merged, spilled runs first and in-memory groups last."""
+        in_memory = [Grouped() for _ in self.paths]
+        for key, partial in self.memory.groups.items():
+            in_memory[stable_hash(key) % len(self.paths)].groups[key] = partial
+
+        for path, recent in zip(self.paths, in_memory):
+            grouped = Grouped()
+            if os.path.exists(path):
+                with open(path) as f:
+                    for line in f:
+                        key, state = json.loads(line)
+                        key, partial = json_key(key), load_partial(state)
+                        mine = grouped.groups.get(key)
+                        if mine is None:
+                            grouped.groups[key] = partial
+                        else:
+                            mine.merge(partial)
+            grouped.merge(recent)
+            yield grouped
+
+    def result(self) -> dict:
+        results = {}
+        for grouped in self.partitions():
+            results.update(grouped.result())
+        return results
+
+    def to_state(self) -> list:
+        state = []
+        for grouped in self.partitions():
+            state.extend(grouped.to_state())
+        return state
+
+    @classmethod
+    def from_state(cls, state: list) -> Grouped:
+        return Grouped.from_state(state)
@@ -0,0 +1,199 @@
+"""
+Deterministic synthetic AIS data in the layout of the Danish Maritime Authority exports.
+
+    python -m command.synthetic ./data --rows 1000000 --vessels 500 --days 7
+
+Writes one time-ordered CSV per day with the header and columns of
+`spark.py`'s schema. A `selectivity` share of the vessels sails inside the
+example.yml bounding box and the rest outside it, so that share of rows
+passes the filters.
+"""
+import argparse
+import csv
+import math
+import os
+import random
+from datetime import date, timedelta
+
+from .engine import SCHEMA
+
+# Latitude and longitude bounds filtered by example.yml and spark.py
+BOX = (54.0, 56.0, 12.0, 15.0)
+# Skagerrak and the northern North Sea, clear of BOX
+OUTSIDE = (56.5, 58.0, 7.5, 11.5)
+
+SHIP_TYPES = {
+    # type: (share of fleet, cruising speed in knots)
+    "Cargo": (0.30, 13.0),
+    "Tanker": (0.15, 12.0),
+    "Fishing": (0.15, 7.0),
+    "Passenger": (0.10, 18.0),
+    "Pleasure": (0.10, 6.0),
+    "Tug": (0.05, 9.0),
+    "Sailing": (0.05, 5.0),
+    "Undefined": (0.10, 8.0),
+}
+DESTINATIONS = ("AARHUS", "COPENHAGEN", "GOTHENBURG", "KIEL", "ROSTOCK", "SKAGEN", "UNKNOWN")
+MODES = ("tracks", "random")
+
+
+class Vessel:
+    """Static data of one ship and its position, advanced by dead reckoning."""
+
+    def __init__(self, rng: random.Random, index: int, region: tuple[float, float, float, float]):
+        self.rng = rng
+        self.region = region
+        self.mmsi = 219000000 + index
+        self.ship_type = rng.choices(list(SHIP_TYPES), [share for share, _ in SHIP_TYPES.values()])[0]
+        self.cruise = SHIP_TYPES[self.ship_type][1]
+        self.moored = rng.random() < 0.1
+        self.class_a = self.ship_type not in ("Pleasure", "Sailing")
+        self.imo = f"{9000000 + index}" if self.class_a else "Unknown"
+        self.callsign = "OU" + "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789") for _ in range(4))
+        self.name = f"SYNTHETIC {index}"
+        self.width = rng.randint(4, 40)
+        self.length = self.width * rng.randint(4, 7)
+        self.draught = f"{rng.uniform(1.0, 12.0):.1f}"
+        self.destination = rng.choice(DESTINATIONS)
+
+        south, north, west, east = region
+        self.lat = rng.uniform(south, north)
+        self.lon = rng.uniform(west, east)
+        self.sog = 0.0 if self.moored else rng.uniform(0.7, 1.1) * self.cruise
+        self.cog = rng.uniform(0, 360)
+
+    def advance(self, seconds: float, mode: str):
+        rng = self.rng
+        south, north, west, east = self.region
+        if mode == "random":
+            self.lat = rng.uniform(south, north)
+            self.lon = rng.uniform(west, east)
+            self.sog = rng.uniform(0, 1.5 * self.cruise)
+            self.cog = rng.uniform(0, 360)
+            return
+
+        if self.moored:
+            # GPS jitter around the berth
+            self.lat += rng.gauss(0, 2e-5)
+            self.lon += rng.gauss(0, 2e-5)
+            self.sog = abs(rng.gauss(0, 0.1))
+            return
+
+        distance = self.sog * seconds / 3600 / 60  # degrees of latitude
+        course = math.radians(self.cog)
+        self.lat += distance * math.cos(course)
+        self.lon += distance * math.sin(course) / math.cos(math.radians(self.lat))
+        # Turn back into the region by mirroring the course at its edges
+        if not south <= self.lat <= north:
+            self.lat = min(max(self.lat, south), north)
+            self.cog = 180 - self.cog
+        if not west <= self.lon <= east:
+            self.lon = min(max(self.lon, west), east)
+            self.cog = -self.cog
+        self.cog = (self.cog + rng.gauss(0, 3)) % 360
+        self.sog = min(max(self.sog + rng.gauss(0, 0.3), 0.0), 1.5 * self.cruise)
+
+    def row(self, timestamp: str, eta: str) -> list[str]:
+        rng = self.rng
+        status = "Moored" if self.moored else "Under way using engine" if self.class_a else "Unknown value"
+        return [
+            timestamp,
+            "Class A" if self.class_a else "Class B",
+            str(self.mmsi),
+            f"{self.lat:.6f}",
+            f"{self.lon:.6f}",
+            status,
+            f"{rng.uniform(-5, 5):.1f}" if self.class_a and not self.moored else "",
+            f"{self.sog:.1f}",
+            f"{self.cog:.1f}",
+            str(round(self.cog) % 360) if self.class_a else "",
+            self.imo,
+            self.callsign,
+            self.name,
+            self.ship_type,
+            "" if self.ship_type != "Tanker" else "Category X",
+            str(self.width),
+            str(self.length),
+            "GPS" if self.class_a else "Undefined",
+            self.draught if self.class_a else "",
+            self.destination if self.class_a else "Unknown",
+            eta if self.class_a else "",
+            "AIS",
+            "", "", "", "",
+        ]
+
+
+def _daily_counts(total: int, parts: int) -> list[int]:
+    size, extra = divmod(total, parts)
+    return [size + (i < extra) for i in range(parts)]
+
+
+def generate(directory: str, rows: int, vessels: int = 100, days: int = 1, selectivity: float = 0.5,
+             mode: str = "tracks", seed: int = 0, start: date = date(2024, 1, 1)) -> list[str]:
+    """Write `days` daily CSVs totalling `rows` rows and return their paths."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode {mode}, expected one of {MODES}")
+    if not 0 <= selectivity <= 1:
+        raise ValueError("selectivity must be between 0 and 1")
+    rng = random.Random(seed)
+    inside = round(selectivity * vessels)
+    fleet = [Vessel(rng, i, BOX if i < inside else OUTSIDE) for i in range(vessels)]
+    last = [None] * vessels
+
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for day, day_rows in enumerate(_daily_counts(rows, days)):
+        current = start + timedelta(days=day)
+        midnight = (current.toordinal() - date(1970, 1, 1).toordinal()) * 86400
+        prefix = current.strftime("%d/%m/%Y")
+        eta = (current + timedelta(days=1)).strftime("%d/%m/%Y 12:00:00")
+
+        # Each vessel reports at its own random seconds of the day
+        events = []
+        for v, count in enumerate(_daily_counts(day_rows, vessels)):
+            if count <= 86400:
+                seconds = rng.sample(range(86400), count)
+            else:
+                seconds = rng.choices(range(86400), k=count)
+            events.extend((second, v) for second in seconds)
+        events.sort()
+
+        path = os.path.join(directory, f"aisdk-{current.isoformat()}.csv")
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(SCHEMA)
+            for second, v in events:
+                now = midnight + second
+                vessel = fleet[v]
+                if last[v] is not None:
+                    vessel.advance(now - last[v], mode)
+                last[v] = now
+                h, rest = divmod(second, 3600)
+                timestamp = f"{prefix} {h:02d}:{rest // 60:02d}:{rest % 60:02d}"
+                writer.writerow(vessel.row(timestamp, eta))
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic AIS CSVs")
+    parser.add_argument("directory", type=str)
+    parser.add_argument("--rows", type=int, default=100000, help="Total rows over all days")
+    parser.add_argument("--vessels", type=int, default=100)
+    parser.add_argument("--days", type=int, default=1, help="One CSV per day")
+    parser.add_argument("--selectivity", type=float, default=0.5,
+                        help="Share of vessels, and so of rows, inside the bounding box")
+    parser.add_argument("--mode", choices=MODES, default="tracks",
+                        help="tracks: dead-reckoned trajectories, random: uniformly random positions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start", type=date.fromisoformat, default=date(2024, 1, 1), help="First day, YYYY-MM-DD")
+    args = parser.parse_args()
+
+    paths = generate(args.directory, args.rows, args.vessels, args.days, args.selectivity, args.mode,
+                     args.seed, args.start)
+    for path in paths:
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
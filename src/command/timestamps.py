@@ -0,0 +1,120 @@
+from datetime import date, datetime, timezone
+from typing import Iterable
+
+# AIS exports use the first; the others cover re-exported data
+TIMESTAMP_FORMATS = ("%d/%m/%Y %H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S")
+
+# Stored for unparseable optional timestamps such as an empty ETA
+MISSING_TIME = -(1 << 63)
+
+_WIDTHS = {'d': 2, 'm': 2, 'Y': 4, 'H': 2, 'M': 2, 'S': 2}
+_EPOCH = date(1970, 1, 1).toordinal()
+
+
+def parse_timestamp(value: str, formats: Iterable[str] = TIMESTAMP_FORMATS) -> int | None:
+    """Slow path: epoch seconds via strptime, or None if no format matches."""
+    for fmt in formats:
+        try:
+            return int(datetime.strptime(value, fmt).replace(tzinfo=timezone.utc).timestamp())
+        except ValueError:
+            continue
+    return None
+
+
+class TimestampFormat:
+    """
+    Fixed-offset decoder for one strptime format.
+
+    Fields are read straight from their character offsets, and the day part
+    is cached per distinct date string, which in a daily AIS file means once.
+    Anything that does not fit the layout goes through `parse_timestamp`.
+    """
+
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self.fields: dict[str, slice] = {}
+        self.literals: list[tuple[int, str]] = []
+        self._days: dict[str, int] = {}
+
+        pos, i = 0, 0
+        fixed = True
+        while i < len(fmt):
+            if fmt[i] == '%' and i + 1 < len(fmt):
+                width = _WIDTHS.get(fmt[i + 1])
+                if width is None:
+                    fixed = False
+                    break
+                self.fields[fmt[i + 1]] = slice(pos, pos + width)
+                pos += width
+                i += 2
+            else:
+                self.literals.append((pos, fmt[i]))
+                pos += 1
+                i += 1
+        self.length = pos
+
+        # The day cache keys on a prefix holding every date field and no time field
+        if fixed and set('Ymd') <= self.fields.keys():
+            self.date_end = max(self.fields[f].stop for f in 'Ymd')
+            fixed = all(self.fields[f].start >= self.date_end for f in 'HMS' if f in self.fields)
+        self.fixed = fixed
+
+    def _day(self, value: str) -> int:
+        key = value[:self.date_end]
+        day = self._days.get(key)
+        if day is None:
+            fields = self.fields
+            parts = [value[fields[f]] for f in 'Ymd']
+            if not all(part.isdigit() for part in parts):
+                raise ValueError(value)
+            day = date(*map(int, parts)).toordinal() - _EPOCH
+            self._days[key] = day
+        return day
+
+    def decode(self, value: str) -> int | None:
+        if self.fixed and len(value) == self.length:
+            try:
+                for pos, char in self.literals:
+                    if value[pos] != char:
+                        raise ValueError(value)
+                fields = self.fields
+                # int() would also take signs and spaces, which strptime rejects
+                h = value[fields['H']] if 'H' in fields else '0'
+                m = value[fields['M']] if 'M' in fields else '0'
+                s = value[fields['S']] if 'S' in fields else '0'
+                if h.isdigit() and m.isdigit() and s.isdigit():
+                    h, m, s = int(h), int(m), int(s)
+                    if h < 24 and m < 60 and s < 60:
+                        return self._day(value) * 86400 + h * 3600 + m * 60 + s
+            except ValueError:
+                pass
+        if not value:
+            return None
+        return parse_timestamp(value, (self.fmt, *TIMESTAMP_FORMATS))
+
+
+def detect_format(values: Iterable[str]) -> TimestampFormat:
+    """Pick the format of the first non-empty value; called once per file."""
+    for value in values:
+        if not value:
+            continue
+        for fmt in TIMESTAMP_FORMATS:
+            try:
+                datetime.strptime(value, fmt)
+                return TimestampFormat(fmt)
+            except ValueError:
+                continue
+        break
+    return TimestampFormat(TIMESTAMP_FORMATS[0])
+
+
+_weeks: dict[int, str] = {}
+
+
+def iso_week(epoch: int) -> str:
+    day = epoch // 86400
+    week = _weeks.get(day)
+    if week is None:
+        year, number, _ = date.fromordinal(day + _EPOCH).isocalendar()
+        week = _weeks[day] = f'{year}-W{number:02d}'
+    return week
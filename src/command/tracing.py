@@ -0,0 +1,246 @@
+"""
+Trace spans and a sampling profiler, exported as Chrome trace-event JSON.
+
+Tracing is off until `enable()` is called, and `span` then costs a flag
+and a context variable check. The current span lives in that variable, so
+asyncio tasks and `asyncio.to_thread` calls nest under whoever started
+them. Across the network the (trace id, span id) pair from `context()`
+rides in the request and is picked up with `attach()`, which traces the
+remote side of that request even where tracing is off. Workers send their
+spans back with the reply and `add()` folds them in, so one export covers
+the whole job. Load the file in chrome://tracing or https://ui.perfetto.dev.
+"""
+import contextvars
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+_current: contextvars.ContextVar[tuple[str, str] | None] = contextvars.ContextVar('span', default=None)
+
+
+def now() -> int:
+    """Epoch microseconds, the trace-event clock."""
+    return time.time_ns() // 1000
+
+
+def _new_id(size: int = 8) -> str:
+    return os.urandom(size).hex()
+
+
+class Tracer:
+    """Collects finished spans as Chrome "complete" events."""
+
+    def __init__(self):
+        self.enabled = False
+        self.process = f'{socket.gethostname()}:{os.getpid()}'
+        self.events: list[dict] = []
+        self._lock = threading.Lock()
+
+    @property
+    def pid(self) -> int:
+        """Trace-event pid, unique per host and process so nodes with the same OS pid keep their own tracks."""
+        return zlib.crc32(self.process.encode()) & 0x7fffffff
+
+    def active(self) -> bool:
+        return self.enabled or _current.get() is not None
+
+    def _event(self, event: dict):
+        with self._lock:
+            self.events.append(event)
+
+    def record(self, name: str, start: int, end: int, cat: str = 'compute',
+               trace: tuple[str, str] | None = None, **args):
+        """Add a span that was timed elsewhere, with `start`/`end` from `now()`."""
+        if not self.active():
+            return
+        parent = trace or _current.get()
+        self._event({
+            'name': name, 'cat': cat, 'ph': 'X', 'ts': start, 'dur': end - start,
+            'pid': self.pid, 'tid': threading.get_ident(),
+            'args': {
+                'trace_id': parent[0] if parent else _new_id(16),
+                'span_id': _new_id(),
+                'parent_id': parent[1] if parent else None,
+                **args,
+            },
+        })
+
+    def instant(self, name: str, cat: str = 'compute', **args):
+        if not self.active():
+            return
+        parent = _current.get()
+        self._event({
+            'name': name, 'cat': cat, 'ph': 'i', 's': 't', 'ts': now(),
+            'pid': self.pid, 'tid': threading.get_ident(),
+            'args': {'trace_id': parent[0] if parent else None, 'parent_id': parent[1] if parent else None, **args},
+        })
+
+    @contextmanager
+    def span(self, name: str, cat: str = 'compute', **args) -> Iterator[dict]:
+        """Time the block as a child of the current span; `args` can be extended inside it."""
+        if not self.active():
+            yield args
+            return
+
+        parent = _current.get()
+        trace_id = parent[0] if parent else _new_id(16)
+        span_id = _new_id()
+        token = _current.set((trace_id, span_id))
+        start = now()
+        try:
+            yield args
+        except BaseException as e:
+            args['error'] = type(e).__name__
+            raise
+        finally:
+            _current.reset(token)
+            self._event({
+                'name': name, 'cat': cat, 'ph': 'X', 'ts': start, 'dur': now() - start,
+                'pid': self.pid, 'tid': threading.get_ident(),
+                'args': {'trace_id': trace_id, 'span_id': span_id,
+                         'parent_id': parent[1] if parent else None, **args},
+            })
+
+    def context(self) -> dict | None:
+        """The current span as a message header, or None when not tracing."""
+        current = _current.get()
+        if current is None:
+            return None
+        return {'trace_id': current[0], 'span_id': current[1]}
+
+    @contextmanager
+    def attach(self, header: dict | None):
+        """Continue a remote trace; a no-op without a header."""
+        if not header:
+            yield
+            return
+        token = _current.set((header['trace_id'], header['span_id']))
+        try:
+            yield
+        finally:
+            _current.reset(token)
+
+    def take(self, trace_id: str) -> list[dict]:
+        """Remove and return the events of one trace, e.g. to send them back to its origin."""
+        with self._lock:
+            taken = [e for e in self.events if e['args'].get('trace_id') == trace_id]
+            self.events = [e for e in self.events if e['args'].get('trace_id') != trace_id]
+        return [self._process_name()] + taken if taken else []
+
+    def add(self, events: Iterable[dict]):
+        with self._lock:
+            self.events.extend(events)
+
+    def to_chrome(self) -> dict:
+        with self._lock:
+            events = list(self.events)
+        return {'traceEvents': [self._process_name()] + events, 'displayTimeUnit': 'ms'}
+
+    def _process_name(self) -> dict:
+        return {'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': {'name': self.process}}
+
+    def export(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.to_chrome(), f)
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+
+
+class SamplingProfiler:
+    """
+    Samples every thread's Python stack each `interval` seconds.
+
+    Runs of identical frames become nested complete events on the thread
+    they were sampled from, which trace viewers draw as a flame chart
+    alongside the spans.
+    """
+
+    def __init__(self, tracer: Tracer, interval: float = 0.005, max_depth: int = 64):
+        self.tracer = tracer
+        self.interval = interval
+        self.max_depth = max_depth
+        self._open: dict[int, list[tuple[str, int]]] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            end = now()
+            for tid in list(self._open):
+                self._close(tid, 0, end)
+
+    def _close(self, tid: int, keep: int, end: int):
+        frames = self._open.get(tid, [])
+        while len(frames) > keep:
+            name, start = frames.pop()
+            self.tracer._event({
+                'name': name, 'cat': 'profile', 'ph': 'X', 'ts': start, 'dur': end - start,
+                'pid': self.tracer.pid, 'tid': tid, 'args': {},
+            })
+        if not frames:
+            self._open.pop(tid, None)
+
+    def _sample(self):
+        sampled = now()
+        me = threading.get_ident()
+        seen = set()
+        for tid, frame in sys._current_frames().items():
+            if tid == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            stack = stack[::-1][:self.max_depth]
+
+            frames = self._open.get(tid, [])
+            common = 0
+            while common < min(len(stack), len(frames)) and frames[common][0] == stack[common]:
+                common += 1
+            self._close(tid, common, sampled)
+            self._open.setdefault(tid, []).extend((name, sampled) for name in stack[common:])
+            seen.add(tid)
+
+        for tid in list(self._open):
+            if tid not in seen:
+                self._close(tid, 0, sampled)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+
+TRACER = Tracer()
+span = TRACER.span
+instant = TRACER.instant
+record = TRACER.record
+
+
+def enable():
+    TRACER.enabled = True
+
+
+def disable():
+    TRACER.enabled = False
+
+
+def export(path: str):
+    TRACER.export(path)
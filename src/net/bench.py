@@ -0,0 +1,398 @@
+"""
+Loopback microbenchmarks for the net package.
+
+    python -m net.bench --output bench.json
+
+Measures message round trips and streaming throughput of TCPConnection over
+payload sizes and peer counts, the connection setup rate of TCPServer, and
+how long Networks take to find each other (and notice a leaver) through
+LocalDiscovery, an in-process stand-in for zeroconf. Results are JSON so
+runs on different commits can be diffed.
+
+The scaling run fills one Network with up to tens of thousands of peers and
+reports memory per peer and attribute access cost; tests/test_net.py holds
+their bounds.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import queue
+import socket
+import subprocess
+import threading
+import time
+import tracemalloc
+from typing import Callable
+from uuid import UUID, uuid4
+
+from .node import ActiveDiscovery, DiscoverCallbackType, Network, Node
+from .tcp import TCPConnection, TCPServer
+
+HOST = '127.0.0.1'
+# Keeps the large-payload runs to a few hundred MB each
+MAX_BYTES = 256 << 20
+
+
+def get_random_available_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    """p50/p90/p99/max of durations in seconds, reported in microseconds."""
+    if not values:
+        return {}
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1e6
+    return {'p50_us': pick(0.50), 'p90_us': pick(0.90), 'p99_us': pick(0.99), 'max_us': values[-1] * 1e6}
+
+
+class LocalRegistry:
+    """
+    In-process replacement for the mDNS multicast group.
+
+    Announcements are delivered to every listening LocalDiscovery from one
+    dispatcher thread, like zeroconf's ServiceBrowser, after `delay` seconds.
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.services: dict[UUID, tuple[str, int]] = {}
+        self.listeners: list['LocalDiscovery'] = []
+        self._lock = threading.Lock()
+        self._events: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._dispatch, daemon=True)
+        self._thread.start()
+
+    def register(self, instance: UUID, ip: str, port: int):
+        with self._lock:
+            self.services[instance] = (ip, port)
+            listeners = list(self.listeners)
+        for listener in listeners:
+            self._events.put((listener.add_service, instance, ip, port))
+
+    def unregister(self, instance: UUID):
+        with self._lock:
+            self.services.pop(instance, None)
+            listeners = list(self.listeners)
+        for listener in listeners:
+            self._events.put((listener.remove_service, instance))
+
+    def listen(self, listener: 'LocalDiscovery'):
+        with self._lock:
+            self.listeners.append(listener)
+            services = list(self.services.items())
+        for instance, (ip, port) in services:
+            self._events.put((listener.add_service, instance, ip, port))
+
+    def unlisten(self, listener: 'LocalDiscovery'):
+        with self._lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def _dispatch(self):
+        while True:
+            handler, *args = self._events.get()
+            if self.delay:
+                time.sleep(self.delay)
+            handler(*args)
+
+
+class LocalDiscovery(ActiveDiscovery):
+    """ZeroconfService with the multicast replaced by a LocalRegistry."""
+
+    def __init__(self, registry: LocalRegistry, instance: UUID, ip: str, port: int):
+        self.registry = registry
+        self.instance = instance
+        self.ip = ip
+        self.port = port
+        self.callbacks: set[tuple[DiscoverCallbackType, Callable]] = set()
+        self.nodes: dict[UUID, Node] = {}
+        self._broadcasting = False
+        self._listening = False
+
+    def register_callback(self, callback_type: DiscoverCallbackType, handler: Callable):
+        self.callbacks.add((callback_type, handler))
+
+    def unregister_callback(self, callback_type: DiscoverCallbackType, handler: Callable):
+        self.callbacks.discard((callback_type, handler))
+
+    def _trigger_callback(self, callback_type: DiscoverCallbackType, *args, **kwargs):
+        for cb_type, handler in list(self.callbacks):
+            if cb_type == callback_type:
+                handler(*args, **kwargs)
+
+    def start(self):
+        self.registry.register(self.instance, self.ip, self.port)
+        self.registry.listen(self)
+        self._broadcasting = self._listening = True
+
+    def stop(self):
+        self.registry.unregister(self.instance)
+        self.registry.unlisten(self)
+        self._broadcasting = self._listening = False
+
+    def is_active(self):
+        return self._broadcasting and self._listening
+
+    def add_service(self, instance: UUID, ip: str, port: int):
+        if instance == self.instance or not self._listening:
+            return
+        node = Node(instance)
+        node.add_connection(TCPConnection(ip, port))
+        self.nodes[instance] = node
+        self._trigger_callback(DiscoverCallbackType.OnDiscover, self, node)
+
+    def remove_service(self, instance: UUID):
+        node = self.nodes.pop(instance, None)
+        if node is not None:
+            self._trigger_callback(DiscoverCallbackType.OnRemove, self, node)
+
+
+async def echo(node: Node, conn: TCPConnection):
+    while True:
+        data = await conn.read_message()
+        if data is None or not await conn.write_message(data):
+            return
+
+
+def start_server(port: int) -> TCPServer:
+    server = TCPServer(HOST, port, echo)
+    server.start()
+    while server.server is None:
+        time.sleep(0.01)
+    return server
+
+
+async def _round_trips(conn: TCPConnection, payload: bytes, count: int, latencies: list[float]):
+    for _ in range(count):
+        start = time.perf_counter()
+        await conn.write_message(payload)
+        await conn.read_message()
+        latencies.append(time.perf_counter() - start)
+
+
+async def _stream(conn: TCPConnection, payload: bytes, count: int):
+    async def send():
+        for _ in range(count):
+            await conn.write_message(payload)
+
+    async def receive():
+        for _ in range(count):
+            await conn.read_message()
+
+    await asyncio.gather(send(), receive())
+
+
+async def bench_messages(ports: list[int], size: int, messages: int) -> dict:
+    count = max(20, min(messages, MAX_BYTES // (size * len(ports))))
+    payload = os.urandom(size)
+    conns = [TCPConnection(HOST, port) for port in ports]
+    for conn in conns:
+        await conn.connect()
+    await asyncio.gather(*(_round_trips(conn, payload, 10, []) for conn in conns))
+
+    latencies: list[float] = []
+    start = time.perf_counter()
+    await asyncio.gather(*(_round_trips(conn, payload, count, latencies) for conn in conns))
+    round_trip = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await asyncio.gather(*(_stream(conn, payload, count) for conn in conns))
+    streamed = time.perf_counter() - start
+
+    for conn in conns:
+        await conn.disconnect()
+
+    total = count * len(ports)
+    return {
+        'payload_bytes': size,
+        'peers': len(ports),
+        'messages_per_peer': count,
+        'round_trip': {'messages_per_s': total / round_trip, **percentiles(latencies)},
+        'stream': {'messages_per_s': total / streamed, 'mb_per_s': total * size / streamed / 1e6},
+    }
+
+
+async def _connect_loop(port: int, count: int, connects: list[float], replies: list[float]):
+    for _ in range(count):
+        conn = TCPConnection(HOST, port)
+        start = time.perf_counter()
+        await conn.connect()
+        connected = time.perf_counter()
+        await conn.write_message(b'ping')
+        await conn.read_message()
+        replies.append(time.perf_counter() - start)
+        connects.append(connected - start)
+        await conn.disconnect()
+
+
+async def bench_connections(port: int, connections: int, concurrency: int) -> dict:
+    connects: list[float] = []
+    replies: list[float] = []
+    share, extra = divmod(connections, concurrency)
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _connect_loop(port, share + (i < extra), connects, replies) for i in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+    return {
+        'concurrency': concurrency,
+        'connections': len(replies),
+        'connections_per_s': len(replies) / elapsed,
+        'connect': percentiles(connects),
+        'first_reply': percentiles(replies),
+    }
+
+
+def _wait_until(condition: Callable[[], bool], changed: threading.Event, timeout: float) -> bool:
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return False
+        changed.wait(min(remaining, 0.05))
+        changed.clear()
+    return True
+
+
+def bench_discovery(peers: int, delay: float, timeout: float) -> dict:
+    registry = LocalRegistry(delay)
+    networks = [Network() for _ in range(peers)]
+    changed = threading.Event()
+    notify = lambda network, node: changed.set()
+    for network in networks:
+        network.register_callback(DiscoverCallbackType.OnDiscover, notify)
+        network.register_callback(DiscoverCallbackType.OnRemove, notify)
+
+    discoveries = [
+        LocalDiscovery(registry, network.host_id, HOST, get_random_available_port()) for network in networks
+    ]
+    start = time.perf_counter()
+    for network, discovery in zip(networks, discoveries):
+        network.add_discovery(discovery)
+    joined = _wait_until(lambda: all(len(n.nodes) == peers - 1 for n in networks), changed, timeout)
+    join = time.perf_counter() - start
+
+    leaver = networks[0]
+    start = time.perf_counter()
+    leaver.remove_discovery(discoveries[0])
+    left = _wait_until(lambda: all(leaver.host_id not in n.nodes for n in networks[1:]), changed, timeout)
+    leave = time.perf_counter() - start
+
+    for network, discovery in zip(networks[1:], discoveries[1:]):
+        network.remove_discovery(discovery)
+    return {
+        'peers': peers,
+        'delay_ms': delay * 1e3,
+        'converged': joined and left,
+        'join_ms': join * 1e3,
+        'leave_ms': leave * 1e3,
+    }
+
+
+def _access_ns(nodes: list[Node], access: Callable[[Node], object], rounds: int = 5) -> float:
+    start = time.perf_counter_ns()
+    for _ in range(rounds):
+        for node in nodes:
+            access(node)
+    return (time.perf_counter_ns() - start) / (rounds * len(nodes))
+
+
+def bench_scaling(peers: int) -> dict:
+    network = Network()
+    ids = [uuid4() for _ in range(peers)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i, id in enumerate(ids):
+        node = Node(id)
+        node.add_connection(TCPConnection(f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}', 7000))
+        network.add_node(node)
+    per_peer = (tracemalloc.get_traced_memory()[0] - before) / peers
+    tracemalloc.stop()
+
+    nodes = list(network.nodes.values())
+    return {
+        'peers': peers,
+        'bytes_per_peer': per_peer,
+        'access_ns': {
+            'protocols': _access_ns(nodes, lambda node: node.protocols),
+            'connected': _access_ns(nodes, lambda node: node.connected),
+            'connection': _access_ns(nodes, lambda node: node.connection('TCP', outgoing=True)),
+            'lookup': _access_ns(nodes, lambda node: network.nodes[node.id]),
+        },
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_network(args) -> dict:
+    servers = [start_server(get_random_available_port()) for _ in range(max(args.peers))]
+    ports = [server.port for server in servers]
+    try:
+        messages = [
+            await bench_messages(ports[:peers], size, args.messages)
+            for size in args.sizes for peers in args.peers
+        ]
+        connections = [
+            await bench_connections(ports[0], args.connections, concurrency) for concurrency in args.concurrency
+        ]
+    finally:
+        for server in servers:
+            server.stop()
+    return {'messages': messages, 'connections': connections}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Loopback benchmarks for the net package")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 1024, 16384, 262144],
+                        help="Payload sizes in bytes")
+    parser.add_argument('--peers', type=int, nargs='+', default=[1, 4, 16], help="Concurrent peer counts")
+    parser.add_argument('--messages', type=int, default=2000, help="Messages per peer and payload size")
+    parser.add_argument('--connections', type=int, default=500, help="Connections opened per setup run")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16],
+                        help="Concurrent connects per setup run")
+    parser.add_argument('--discovery-peers', type=int, nargs='+', default=[2, 8, 32])
+    parser.add_argument('--discovery-delay', type=float, default=0.0,
+                        help="Seconds added to every discovery event")
+    parser.add_argument('--timeout', type=float, default=30.0, help="Discovery convergence timeout in seconds")
+    parser.add_argument('--scaling-peers', type=int, nargs='+', default=[1000, 10000, 50000],
+                        help="Network sizes of the scaling run")
+    parser.add_argument('--output', type=str, help="JSON file to write, stdout if omitted")
+    args = parser.parse_args()
+
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.time(),
+    }
+    # The net package prints every connection; keep it out of the results
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        results.update(asyncio.run(run_network(args)))
+        results['discovery'] = [
+            bench_discovery(peers, args.discovery_delay, args.timeout) for peers in args.discovery_peers
+        ]
+        results['scaling'] = [bench_scaling(peers) for peers in args.scaling_peers]
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
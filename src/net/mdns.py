@@ -0,0 +1,129 @@
+from .node import ActiveDiscovery, DiscoverCallbackType, Node
+from .tcp import TCPConnection
+import socket
+from zeroconf import Zeroconf, ServiceInfo, ServiceBrowser, IPVersion
+from uuid import UUID
+from typing import Callable
+
+
+SERVICE_NAME = "_calcp2p._tcp.local."
+
+class ZeroconfService(ActiveDiscovery):
+    """Announces this node at ip:port and finds the others; with `broadcast=False` it only finds them."""
+
+    def __init__(self, instance: UUID, ip: str, port: int, broadcast: bool = True):
+        self.instance: UUID = instance
+        self.ip: str = ip
+        self.port: int = port
+        self.broadcast: bool = broadcast
+
+        self.zeroconf: Zeroconf = Zeroconf()
+        self.info: ServiceInfo | None = None
+        self.browser: ServiceBrowser | None = None
+        
+        self.callbacks: set[tuple[DiscoverCallbackType, Callable]] = set()
+        self.nodes: dict[UUID, Node] = {}
+        
+    def register_callback(self, callback_type: DiscoverCallbackType, handler: Callable):
+        self.callbacks.add((callback_type, handler))
+        
+    def unregister_callback(self, callback_type: DiscoverCallbackType, handler: Callable):
+        self.callbacks.discard((callback_type, handler))
+        
+    def _trigger_callback(self, callback_type: DiscoverCallbackType, *args, **kwargs):
+        for cb_type, handler in self.callbacks:
+            if cb_type == callback_type:
+                handler(*args, **kwargs)
+                
+    def start(self):
+        if self.broadcast:
+            self.start_broadcasting()
+        self.start_listening()
+
+    def stop(self):
+        self.stop_broadcasting()
+        self.stop_listening()
+        
+    def is_active(self):
+        return (self.is_broadcasting() or not self.broadcast) and self.is_listening()
+
+    def start_broadcasting(self):
+        try:
+            ip_bytes = [socket.inet_aton(self.ip)]  # IPv4
+        except OSError:
+            ip_bytes = [socket.inet_pton(socket.AF_INET6, self.ip)]  # IPv6
+
+        self.info = ServiceInfo(
+            SERVICE_NAME,
+            f'{str(self.instance)}.{SERVICE_NAME}',
+            addresses=ip_bytes,
+            port=self.port,
+            properties={},
+            server=f"{socket.gethostname()}.local.",
+        )
+        self.zeroconf.register_service(self.info)
+        print(f"Broadcasting zeroconf '{SERVICE_NAME}' at {self.ip}:{self.port}")
+
+    def stop_broadcasting(self):
+        if self.info:
+            self.zeroconf.unregister_service(self.info)
+            self.info = None
+            print(f"Stopped broadcasting zeroconf '{SERVICE_NAME}'.")
+
+    def start_listening(self):
+        if self.browser is None:
+            self.browser = ServiceBrowser(self.zeroconf, SERVICE_NAME, self)
+            print(f"Listening for zeroconf services of type {SERVICE_NAME}")
+
+    def stop_listening(self):
+        if self.browser is not None:
+            self.zeroconf.close()
+            self.browser = None
+            print("Stopped listening for zeroconf services.")
+
+    def add_service(self, zeroconf: Zeroconf, service_type: str, name: str):
+        info = zeroconf.get_service_info(service_type, name)
+        if not info:
+            print(f'Zeroconf service {name} has no info. Ignoring')
+            return
+        
+        ip = info.parsed_addresses(IPVersion.V4Only)[0]
+        port = info.port
+
+        print(f"Zeroconf service discovered: {name}")
+        print(f"Zeroconf service info: IP={ip}, Port={port}")
+            
+        instance = UUID(name.split('.')[0])
+        if instance == self.instance:
+            print('Zeroconf found instance of itself. Ignoring')
+            return
+
+        node = Node(instance)
+        connection = TCPConnection(ip, port)
+        node.add_connection(connection)
+        
+        self.nodes[instance] = node
+            
+        self._trigger_callback(DiscoverCallbackType.OnDiscover, self, node)
+
+    def remove_service(self, zeroconf: Zeroconf, service_type: str, name: str):
+        print(f"Zeroconf service removed: {name}")
+        
+        instance = UUID(name.split('.')[0])
+        
+        node = self.nodes.pop(instance, None)
+        
+        if node is not None:
+            self._trigger_callback(DiscoverCallbackType.OnRemove, self, node)
+        
+    def update_service(self, zeroconf: Zeroconf, service_type: str, name: str):
+        pass
+
+    def is_broadcasting(self) -> bool:
+        return self.info is not None
+
+    def is_listening(self) -> bool:
+        return self.browser is not None
+
+    def __del__(self):
+        self.stop()
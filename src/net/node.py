@@ -1,11 +1,25 @@
+import sys
 from uuid import UUID, uuid4
 from abc import ABC, abstractmethod
 from enum import Enum
 from typing import Callable
-from collections import deque
+
+
+# One shared tuple per distinct protocol combination, e.g. every TCP-only node shares ('TCP',)
+_PROTOCOL_VIEWS: dict[tuple[str, ...], tuple[str, ...]] = {}
+
+
+def intern_protocol(name: str) -> str:
+    return sys.intern(name)
+
+
+def _protocol_view(protocols: tuple[str, ...]) -> tuple[str, ...]:
+    return _PROTOCOL_VIEWS.setdefault(protocols, protocols)
 
 
 class Connection(ABC):
+    __slots__ = ()
+
     @property
     @abstractmethod
     def protocol(self) -> str:
@@ -36,29 +50,68 @@ class Connection(ABC):
     async def read(self) -> bytes | None:
         pass
 
+    @abstractmethod
+    async def write_message(self, data: bytes) -> bool:
+        pass
+
+    @abstractmethod
+    async def read_message(self) -> bytes | None:
+        pass
+
+    @property
+    def outgoing(self) -> bool:
+        return True
+
 
 class Node:
+    """
+    A peer and its connections, kept small enough to track tens of thousands.
+
+    Connections are a tuple, replaced on the rare add, and the protocol view
+    is rebuilt only then and shared between nodes with the same protocols.
+    """
+
+    __slots__ = ('_id', '_connections', '_protocols')
+
     def __init__(self, id: UUID):
         self._id = id
-        self._connections: deque[Connection] = deque()
+        self._connections: tuple[Connection, ...] = ()
+        self._protocols: tuple[str, ...] = ()
 
     @property
     def id(self) -> UUID:
         return self._id
 
     @property
-    def protocols(self) -> list[str]:
-        return list(set(conn.protocol for conn in self._connections))
+    def protocols(self) -> tuple[str, ...]:
+        return self._protocols
 
     @property
-    def connected(self) -> list[str]:
-        return list(set(conn.protocol for conn in self._connections if conn.connected))
+    def connected(self) -> tuple[str, ...]:
+        if len(self._connections) == 1:
+            conn = self._connections[0]
+            return self._protocols if conn.connected else ()
+        return tuple(
+            protocol for protocol in self._protocols
+            if any(conn.connected for conn in self._connections if conn.protocol == protocol)
+        )
 
     def add_connection(self, conn: Connection) -> bool:
-        exists = not any(_conn == conn for _conn in self._connections)
-        if not exists:
-            self._connections.append(conn)
-        return exists
+        if conn in self._connections:
+            return False
+        self._connections += (conn,)
+        if conn.protocol not in self._protocols:
+            self._protocols = _protocol_view(self._protocols + (intern_protocol(conn.protocol),))
+        return True
+
+    def connection(self, protocol: str | None = None, outgoing: bool | None = None) -> Connection | None:
+        for conn in self._connections:
+            if protocol is not None and conn.protocol != protocol:
+                continue
+            if outgoing is not None and conn.outgoing != outgoing:
+                continue
+            return conn
+        return None
 
     async def is_alive(self, protocol: str | None = None) -> bool:
         for conn in self._connections:
@@ -115,6 +168,7 @@ class Network:
     def __init__(self):
         self.discoveries: set[Connection] = set()
         self.nodes: dict[UUID, Node] = {}
+        self.callbacks: set[tuple[DiscoverCallbackType, Callable]] = set()
         self._id = uuid4()
         print(f'Host ID: {self._id}')
     
@@ -122,6 +176,17 @@ class Network:
     def host_id(self) -> UUID:
         return self._id
 
+    def register_callback(self, callback_type: DiscoverCallbackType, handler: Callable):
+        self.callbacks.add((callback_type, handler))
+
+    def unregister_callback(self, callback_type: DiscoverCallbackType, handler: Callable):
+        self.callbacks.discard((callback_type, handler))
+
+    def _trigger_callback(self, callback_type: DiscoverCallbackType, *args, **kwargs):
+        for cb_type, handler in list(self.callbacks):
+            if cb_type == callback_type:
+                handler(*args, **kwargs)
+
     def add_discovery(self, discovery: ActiveDiscovery):
         discovery.register_callback(
             DiscoverCallbackType.OnDiscover, self._on_node_discover
@@ -139,20 +204,24 @@ class Network:
         existing_node = self.nodes.get(node.id, None)
         if not existing_node:
             self.nodes[node.id] = node
+            return
 
         for conn in node._connections:
             existing_node.add_connection(conn)
 
     def remove_node(self, id: UUID):
-        self.nodes.pop(id)
+        node = self.nodes.pop(id, None)
+        if node is not None:
+            self._trigger_callback(DiscoverCallbackType.OnRemove, self, node)
 
     def _on_node_discover(self, discovery: ActiveDiscovery, node: Node):
         print(f'Network discovered new node {node.id}')
         self.add_node(node)
+        self._trigger_callback(DiscoverCallbackType.OnDiscover, self, self.nodes[node.id])
 
     def _on_node_remove(self, discovery: ActiveDiscovery, node: Node):
         print(f'Network removed node {node.id}')
-        pass
+        self.remove_node(node.id)
 
     def _on_node_update(self, discovery: ActiveDiscovery, node: Node):
         print(f'Network updated node {node.id}')
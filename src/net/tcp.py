@@ -1,11 +1,8 @@
-from node import Connection, ActiveDiscovery, DiscoverCallbackType, Node
+from .node import Connection, ActiveDiscovery, DiscoverCallbackType, Node, intern_protocol
 from enum import Enum
 import asyncio
-import socket
-from zeroconf import Zeroconf, ServiceInfo, ServiceBrowser, IPVersion
 from uuid import uuid4, UUID
-from typing import Callable
-from collections import deque
+from typing import Awaitable, Callable
 import threading
 
 
@@ -15,6 +12,10 @@ class ConnectionType(Enum):
 
 
 class TCPConnection(Connection):
+    __slots__ = ('_ip', '_port', '_connected', '_reader', '_writer', '_conn_type')
+
+    PROTOCOL = intern_protocol("TCP")
+
     def __init__(
         self,
         node_ip: str,
@@ -42,12 +43,16 @@ class TCPConnection(Connection):
 
     @property
     def protocol(self) -> str:
-        return "TCP"
+        return self.PROTOCOL
 
     @property
     def connected(self) -> bool:
         return self._connected
 
+    @property
+    def outgoing(self) -> bool:
+        return self._conn_type == ConnectionType.ClientToServer
+
     async def is_alive(self) -> bool:
         if not self._connected:
             return False
@@ -68,7 +73,7 @@ class TCPConnection(Connection):
 
         try:
             self._reader, self._writer = await asyncio.open_connection(
-                self.ip, self.port
+                self._ip, self._port
             )
             self._connected = True
             print(f"Connected to {self._ip}:{self._port}")
@@ -113,6 +118,33 @@ class TCPConnection(Connection):
             self._connected = False
             return None
 
+    async def write_message(self, data: bytes) -> bool:
+        """Write one length-prefixed message."""
+        if not self._connected or not self._writer:
+            return False
+
+        try:
+            self._writer.write(len(data).to_bytes(4, 'big'))
+            self._writer.write(data)
+            await self._writer.drain()
+            return True
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            print(f"Write failed: {e}")
+            self._connected = False
+            return False
+
+    async def read_message(self) -> bytes | None:
+        """Read one length-prefixed message, or None once the peer is gone."""
+        if not self._connected or not self._reader:
+            return None
+
+        try:
+            header = await self._reader.readexactly(4)
+            return await self._reader.readexactly(int.from_bytes(header, 'big'))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self._connected = False
+            return None
+
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, TCPConnection):
             return False
@@ -127,139 +159,22 @@ class TCPConnection(Connection):
         return hash((self._ip, self._port, self._conn_type))
 
 
-SERVICE_NAME = "_calcp2p._tcp.local."
-
-class ZeroconfService(ActiveDiscovery):
-    def __init__(self, instance: UUID, ip: str, port: int):
-        self.instance: UUID = instance
-        self.ip: str = ip
-        self.port: int = port
-
-        self.zeroconf: Zeroconf = Zeroconf()
-        self.info: ServiceInfo | None = None
-        self.browser: ServiceBrowser | None = None
-        
-        self.callbacks: set[tuple[DiscoverCallbackType, Callable]] = set()
-        self.nodes: deque[Node] = []
-        
-    def register_callback(self, callback_type: DiscoverCallbackType, handler: Callable):
-        self.callbacks.add((callback_type, handler))
-        
-    def unregister_callback(self, callback_type: DiscoverCallbackType, handler: Callable):
-        self.callbacks.discard((callback_type, handler))
-        
-    def _trigger_callback(self, callback_type: DiscoverCallbackType, *args, **kwargs):
-        for cb_type, handler in self.callbacks:
-            if cb_type == callback_type:
-                handler(*args, **kwargs)
-                
-    def start(self):
-        self.start_broadcasting()
-        self.start_listening()
-
-    def stop(self):
-        self.stop_broadcasting()
-        self.stop_listening()
-        
-    def is_active(self):
-        return self.is_broadcasting() and self.is_listening()
-
-    def start_broadcasting(self):
-        try:
-            ip_bytes = [socket.inet_aton(self.ip)]  # IPv4
-        except OSError:
-            ip_bytes = [socket.inet_pton(socket.AF_INET6, self.ip)]  # IPv6
-
-        self.info = ServiceInfo(
-            SERVICE_NAME,
-            f'{str(self.instance)}.{SERVICE_NAME}',
-            addresses=ip_bytes,
-            port=self.port,
-            properties={},
-            server=f"{socket.gethostname()}.local.",
-        )
-        self.zeroconf.register_service(self.info)
-        print(f"Broadcasting zeroconf '{SERVICE_NAME}' at {self.ip}:{self.port}")
-
-    def stop_broadcasting(self):
-        if self.info:
-            self.zeroconf.unregister_service(self.info)
-            self.info = None
-            print(f"Stopped broadcasting zeroconf '{SERVICE_NAME}'.")
-
-    def start_listening(self):
-        if self.browser is None:
-            self.browser = ServiceBrowser(self.zeroconf, SERVICE_NAME, self)
-            print(f"Listening for zeroconf services of type {SERVICE_NAME}")
-
-    def stop_listening(self):
-        if self.browser is not None:
-            self.zeroconf.close()
-            self.browser = None
-            print("Stopped listening for zeroconf services.")
-
-    def add_service(self, zeroconf: Zeroconf, service_type: str, name: str):
-        info = zeroconf.get_service_info(service_type, name)
-        if not info:
-            print(f'Zeroconf service {name} has no info. Ignoring')
-            return
-        
-        ip = info.parsed_addresses(IPVersion.V4Only)[0]
-        port = info.port
-
-        print(f"Zeroconf service discovered: {name}")
-        print(f"Zeroconf service info: IP={ip}, Port={port}")
-            
-        instance = UUID(name.split('.')[0])
-        if instance == self.instance:
-            print('Zeroconf found instance of itself. Ignoring')
-            return
-
-        node = Node(instance)
-        connection = TCPConnection(ip, port)
-        node.add_connection(connection)
-        
-        self.nodes.append(node)
-            
-        self._trigger_callback(DiscoverCallbackType.OnDiscover, self, node)
-
-    def remove_service(self, zeroconf: Zeroconf, service_type: str, name: str):
-        print(f"Zeroconf service removed: {name}")
-        
-        instance = UUID(name.split('.')[0])
-        
-        node = next((node for node in self.nodes if node.id == instance), None)
-        
-        if node is not None:
-            self._trigger_callback(DiscoverCallbackType.OnRemove, self, node)
-            self.nodes.remove(node)
-        
-    def update_service(self, zeroconf: Zeroconf, service_type: str, name: str):
-        pass
-
-    def is_broadcasting(self) -> bool:
-        return self.info is not None
-
-    def is_listening(self) -> bool:
-        return self.browser is not None
-
-    def __del__(self):
-        self.stop()
-
+ConnectionHandler = Callable[[Node, TCPConnection], Awaitable[None]]
 
 class TCPServer(ActiveDiscovery):
-    def __init__(self, host: str, port: int):
+    def __init__(self, host: str, port: int, handler: ConnectionHandler | None = None):
         self.server = None
         self.host = host
         self.port = port
-        self.callbacks: set[tuple[DiscoverCallbackType, Callable]] = []
-        self.nodes = []
+        self.handler = handler
+        self.callbacks: set[tuple[DiscoverCallbackType, Callable]] = set()
+        self.nodes: dict[UUID, Node] = {}
         self._running = False        
         self._loop = None
         self._thread = None
 
     def register_callback(self, callback_type: DiscoverCallbackType, handler: Callable):
-        self.callbacks.append((callback_type, handler))
+        self.callbacks.add((callback_type, handler))
 
     def unregister_callback(self, callback_type: DiscoverCallbackType, handler: Callable):
         self.callbacks.discard((callback_type, handler))
@@ -289,7 +204,11 @@ class TCPServer(ActiveDiscovery):
         print(f"TCP Server started on {self.host}:{self.port}")
         self.server = await asyncio.start_server(self._handle_client, self.host, self.port)
         async with self.server:
-            await self.server.serve_forever()
+            try:
+                await self.server.serve_forever()
+            except asyncio.CancelledError:
+                # stop() closes the server, which cancels serve_forever
+                pass
 
     async def _stop_server(self):
         if self.server:
@@ -313,9 +232,18 @@ class TCPServer(ActiveDiscovery):
         connection = TCPConnection(ip, port, reader, writer, ConnectionType.ServerToClient)
         node = Node(instance)
         node.add_connection(connection)
-        self.nodes.append(node)
+        self.nodes[instance] = node
         self._trigger_callback(DiscoverCallbackType.OnDiscover, self, node)
 
+        if self.handler is not None:
+            try:
+                await self.handler(node, connection)
+            finally:
+                # The handler owns the connection; once it returns the client is gone,
+                # from here and from every network that was told about it
+                self.nodes.pop(instance, None)
+                self._trigger_callback(DiscoverCallbackType.OnRemove, self, node)
+
     def __del__(self):
         self.stop()
 
@@ -1,5 +1,6 @@
-from node import Network
-from tcp import ZeroconfService, TCPServer
+from .node import Network
+from .tcp import TCPServer
+from .mdns import ZeroconfService
 import time
 import socket
 
@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+# The packages live in src/ and are run from there, e.g. `python -m command.synthetic`
+sys.path.insert(0, SRC)
+
+EXAMPLE_PLAN = os.path.join(SRC, 'command', 'example.yml')
+
+
+def assert_close(actual, expected):
+    """Equal results, with floats compared approximately since merge order changes rounding."""
+    if isinstance(expected, dict):
+        assert actual.keys() == expected.keys()
+        for key in expected:
+            assert_close(actual[key], expected[key])
+    elif isinstance(expected, (list, tuple)):
+        assert len(actual) == len(expected)
+        for a, e in zip(actual, expected):
+            assert_close(a, e)
+    elif isinstance(expected, float):
+        assert actual == pytest.approx(expected)
+    else:
+        assert actual == expected
+
+
+@pytest.fixture(scope='session')
+def shards(tmp_path_factory) -> list[str]:
+    """Three daily synthetic AIS files, most vessels reporting on every day."""
+    from command.synthetic import generate
+
+    return generate(str(tmp_path_factory.mktemp('ais')), rows=6000, vessels=30, days=3)
+
+
+@pytest.fixture(scope='session')
+def plan():
+    from command.plan import Plan
+
+    return Plan.load(EXAMPLE_PLAN)
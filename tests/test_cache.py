@@ -0,0 +1,116 @@
+import asyncio
+import os
+import time
+from uuid import uuid4
+
+import pytest
+
+from command.cache import ResultCache, cache_key, file_fingerprint
+from command.distributed import DistributedExecutor, Worker, cache_keys
+from command.engine import Executor
+from command.partials import load_partials
+from command.plan import Plan
+from net.bench import get_random_available_port
+from net.node import Network, Node
+from net.tcp import TCPConnection, TCPServer
+
+from .conftest import assert_close
+
+
+def test_fingerprint_follows_stat(tmp_path):
+    path = tmp_path / 'a.csv'
+    path.write_text('x\n1\n')
+    before = file_fingerprint(str(path))
+    assert file_fingerprint(str(tmp_path / '.' / 'a.csv')) == before
+
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert file_fingerprint(str(path)) != before
+
+
+def test_cache_key_covers_what_shapes_results():
+    plan = Plan.from_dict({'id': 'a', 'operations': ['Fast = SOG > 5', 'Avg: groupby("Ship type").mean(SOG)']})
+    inputs = ['a:1:1', 'b:1:1']
+    key = cache_key(plan, plan.queries[0], inputs)
+
+    # Neither the id, the data, spacing and quoting, nor the order of inputs change what is computed
+    same = Plan.from_dict({
+        'id': 'b', 'data': ['x.csv'], 'operations': ['Fast=SOG>5', "Avg:  groupby('Ship type').mean( SOG )"],
+    })
+    assert cache_key(same, same.queries[0], inputs[::-1]) == key
+
+    assert cache_key(plan, plan.queries[0], ['a:1:2', 'b:1:1']) != key
+    approximate = Plan(plan.id, plan.operations, approximate={})
+    assert cache_key(approximate, approximate.queries[0], inputs) != key
+    other = Plan.from_dict({'id': 'a', 'operations': ['Fast = SOG > 6', 'Avg: groupby("Ship type").mean(SOG)']})
+    assert cache_key(other, other.queries[0], inputs) != key
+
+
+def test_lru_evicts_by_bytes():
+    cache = ResultCache(max_bytes=10)
+    cache.put('a', b'1234')
+    cache.put('b', b'1234')
+    assert cache.get('a') == b'1234'
+    cache.put('c', b'1234')
+    assert cache.get('b') is None
+    assert cache.get('a') == b'1234' and cache.get('c') == b'1234'
+    assert cache.size == 8
+    cache.put('huge', b'x' * 11)
+    assert cache.get('huge') is None and len(cache) == 2
+
+
+def test_worker_fills_and_answers_from_cache(plan, shards, capsys):
+    worker = Worker(cache=ResultCache())
+    request = {'type': 'execute', 'job': '1', 'plan': plan.to_dict(), 'shards': shards}
+    first = asyncio.run(worker.dispatch(request))
+    keys = cache_keys(plan, shards)
+    assert len(worker.cache) == len(keys)
+
+    second = asyncio.run(worker.dispatch(request))
+    assert 'answered plan' in capsys.readouterr().out
+    executor = Executor(plan)
+    assert_close(executor.finalize(load_partials(second['partials'])),
+                 executor.finalize(load_partials(first['partials'])))
+
+    reply = asyncio.run(worker.dispatch({'type': 'cache_get', 'job': '2', 'keys': [*keys.values(), 'missing']}))
+    assert sorted(reply['entries']) == sorted(keys.values())
+
+
+@pytest.fixture
+def peer():
+    worker = Worker(cache=ResultCache())
+    port = get_random_available_port()
+    network = Network()
+    server = TCPServer('127.0.0.1', port, worker.handle)
+    network.add_discovery(server)
+    time.sleep(0.2)
+    try:
+        yield worker, port
+    finally:
+        network.remove_discovery(server)
+
+
+def test_coordinators_reuse_partitions_cached_on_peers(plan, shards, peer):
+    worker, port = peer
+    expected = Executor(plan)
+    expected = expected.finalize(expected.run(shards))
+
+    def coordinate():
+        network = Network()
+        node = Node(uuid4())
+        node.add_connection(TCPConnection('127.0.0.1', port))
+        network.add_node(node)
+        # A fresh coordinator cache each time, so a second run can only hit on the peer
+        executor = DistributedExecutor(network, plan, local=False, cache=ResultCache(), partition_size=1)
+        return asyncio.run(executor.collect(shards))
+
+    assert_close(coordinate(), expected)
+    keys = sum(len(cache_keys(plan, [path])) for path in shards)
+    assert len(worker.cache) == keys
+    assert worker.cache.hits == 0
+    misses = worker.cache.misses
+
+    # Every partition of the second run comes from the peer's cache without running it again
+    assert_close(coordinate(), expected)
+    assert worker.cache.hits == keys
+    assert worker.cache.misses == misses
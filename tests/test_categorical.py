@@ -0,0 +1,96 @@
+import ast
+from array import array
+
+import pytest
+
+from command.categorical import Categorical
+from command.engine import Executor, Table, evaluate_mask, group_by, read_csv
+from command.parallel import concat
+from command.plan import Column, Plan
+
+from .conftest import assert_close
+
+
+def test_codes_and_dictionary():
+    column = Categorical()
+    for value in ['b', 'a', 'b', 'c', 'a', 'b']:
+        column.append(value)
+    assert list(column) == ['b', 'a', 'b', 'c', 'a', 'b']
+    assert list(column.codes) == [0, 1, 0, 2, 1, 0]
+    assert column.code('c') == 2 and column.code('d') is None
+    assert column.counts() == {'b': 3, 'a': 2, 'c': 1}
+
+    taken = column.take([3, 0])
+    assert list(taken) == ['c', 'b'] and taken.dictionary is column.dictionary
+    # Values that no longer occur are left out of the counts
+    assert taken.counts() == {'c': 1, 'b': 1}
+
+
+def test_codes_widen_past_16_bits():
+    column = Categorical()
+    for i in range(0x10000):
+        column.append(str(i))
+    assert column.codes.typecode == 'H'
+    column.append('last')
+    assert column.codes.typecode == 'I'
+    assert column[0x10000] == 'last' and column[0] == '0' and column.code('last') == 0x10000
+
+
+def test_concat_merges_dictionaries():
+    first, second = Categorical(), Categorical()
+    for value in ['x', 'y', 'x']:
+        first.append(value)
+    for value in ['z', 'x', 'z']:
+        second.append(value)
+    numbers = [array('q', [1, 2, 3]), array('q', [4, 5, 6])]
+
+    merged = concat([{'c': first, 'n': memoryview(numbers[0])}, {'c': second, 'n': memoryview(numbers[1])}])
+    assert list(merged['c']) == ['x', 'y', 'x', 'z', 'x', 'z']
+    assert merged['c'].dictionary == ['x', 'y', 'z']
+    assert list(merged['n']) == [1, 2, 3, 4, 5, 6]
+
+
+@pytest.fixture(scope='module')
+def tables(shards) -> tuple[Table, Table]:
+    """A shard as read, and the same shard with its categoricals as plain lists."""
+    table = read_csv(shards[0])
+    plain = Table({name: list(values) if isinstance(values, Categorical) else values
+                   for name, values in table.columns.items()})
+    assert isinstance(table.columns['Ship type'], Categorical)
+    return table, plain
+
+
+@pytest.mark.parametrize('expression', [
+    'col("Ship type") == "Cargo"',
+    '"Cargo" != col("Ship type")',
+    'col("Ship type") == "Submarine"',
+    'col("Ship type") != "Submarine"',
+    'col("Ship type") > "Passenger"',  # not on the codes
+    'col("Ship type") == "Fishing" or SOG > 10',
+    '"Fishing" == col("Ship type") == "Fishing"',
+])
+def test_filters_match_plain_strings(tables, expression):
+    table, plain = tables
+    expr = ast.parse(expression, mode='eval').body
+    assert evaluate_mask(expr, table) == evaluate_mask(expr, plain)
+
+
+def test_group_by_matches_plain_strings(tables):
+    table, plain = tables
+    for name in ('Ship type', 'Destination'):
+        assert group_by(table, Column(name)) == group_by(plain, Column(name))
+
+
+def test_queries_match_plain_strings(tables):
+    table, plain = tables
+    plan = Plan.from_dict({'id': 'c', 'operations': [
+        'Cargo = col("Ship type") != "Cargo"',
+        'Types: groupby("Ship type").nunique(MMSI)',
+        'Destinations: groupby(MMSI).nunique(Destination)',
+        'Speeds: groupby("Ship type").mean(SOG)',
+        'Summary: describe(["Ship type", "Destination", "SOG"])',
+    ]})
+    executor = Executor(plan)
+    results = [executor.finalize(executor.run_table(executor._filter(t))) for t in (table, plain)]
+    assert 'Cargo' not in results[0]['Types']
+    assert_close(results[0], results[1])
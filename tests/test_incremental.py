@@ -0,0 +1,59 @@
+import os
+import shutil
+
+import pytest
+
+from command.engine import Executor
+from command.incremental import IncrementalExecutor, StateStore
+
+from .conftest import assert_close
+
+
+def full(plan, paths):
+    executor = Executor(plan)
+    return executor.finalize(executor.run(paths))
+
+
+@pytest.fixture
+def copies(shards, tmp_path) -> list[str]:
+    """The shards copied somewhere their mtimes can be changed."""
+    directory = tmp_path / 'data'
+    directory.mkdir()
+    return [shutil.copy(path, directory) for path in shards]
+
+
+def processed(capsys) -> list[str]:
+    prefix = 'Processing new or changed file '
+    return [line[len(prefix):] for line in capsys.readouterr().out.splitlines() if line.startswith(prefix)]
+
+
+def test_appended_files_only(plan, copies, tmp_path, capsys):
+    executor = IncrementalExecutor(plan, StateStore(str(tmp_path / 'state')))
+    assert_close(executor.collect(copies[:2]), full(plan, copies[:2]))
+    assert processed(capsys) == copies[:2]
+
+    assert_close(executor.collect(copies), full(plan, copies))
+    assert processed(capsys) == copies[2:]
+
+    assert_close(executor.collect(copies), full(plan, copies))
+    assert processed(capsys) == []
+
+
+def test_changed_and_backfilled_files(plan, copies, tmp_path, capsys):
+    state = str(tmp_path / 'state')
+    IncrementalExecutor(plan, state).collect(copies[1:])
+    processed(capsys)
+
+    # A back-filled day sorts before what was merged, so the total is rebuilt from stored states
+    executor = IncrementalExecutor(plan, state)
+    assert_close(executor.collect(copies), full(plan, copies))
+    assert processed(capsys) == copies[:1]
+
+    stat = os.stat(copies[1])
+    os.utime(copies[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert_close(executor.collect(copies), full(plan, copies))
+    assert processed(capsys) == copies[1:2]
+
+    # A removed file drops out of the total
+    assert_close(executor.collect(copies[:2]), full(plan, copies[:2]))
+    assert processed(capsys) == []
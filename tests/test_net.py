@@ -0,0 +1,19 @@
+from net.bench import bench_scaling
+
+# A Node with one TCPConnection, its UUID, address and Network entry
+MAX_BYTES_PER_PEER = 512
+MAX_ACCESS_GROWTH = 2.0
+
+
+def test_peer_memory_bound():
+    run = bench_scaling(10_000)
+    assert run['bytes_per_peer'] <= MAX_BYTES_PER_PEER
+
+
+def test_peer_access_does_not_grow():
+    # The fastest of a few runs, so a busy machine does not fail the bound
+    small = [bench_scaling(1_000)['access_ns'] for _ in range(3)]
+    large = [bench_scaling(10_000)['access_ns'] for _ in range(3)]
+    for name in small[0]:
+        fastest = min(run[name] for run in small)
+        assert min(run[name] for run in large) <= MAX_ACCESS_GROWTH * fastest, name
@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+from command import parallel
+from command.engine import Executor, byte_ranges, read_csv
+from command.parallel import ParallelExecutor, create_pool
+
+from .conftest import assert_close
+
+
+@pytest.fixture(scope='module')
+def expected(plan, shards):
+    executor = Executor(plan)
+    return executor.finalize(executor.run(shards))
+
+
+@pytest.fixture(scope='module')
+def pool():
+    pool = create_pool(2)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.mark.parametrize('parts', [1, 2, 7, 64])
+def test_byte_ranges_cover_every_row_once(shards, parts):
+    whole = read_csv(shards[0]).columns
+    pieces = [read_csv(shards[0], start=start, stop=stop).columns for start, stop in byte_ranges(shards[0], parts)]
+    for name in ('MMSI', '# Timestamp', 'Ship type'):
+        assert [value for piece in pieces for value in piece[name]] == list(whole[name])
+
+
+@pytest.mark.parametrize('range_bytes', [1 << 30, 50_000])
+def test_matches_executor(plan, shards, expected, pool, monkeypatch, range_bytes):
+    # Small ranges make every shard several map tasks whose blocks are concatenated per partition
+    monkeypatch.setattr(parallel, 'MIN_RANGE_BYTES', range_bytes)
+    done = []
+    with ParallelExecutor(plan, 2, pool=pool) as executor:
+        assert_close(executor.finalize(executor.run(shards, done.append)), expected)
+    assert done == [1, 2, 3]
+
+
+def test_matches_executor_under_budget(plan, shards, expected, pool, monkeypatch):
+    monkeypatch.setattr(parallel, 'MIN_RANGE_BYTES', 50_000)
+    executor = ParallelExecutor(plan, 2, memory_budget=5_000, pool=pool)
+    assert_close(executor.finalize(executor.run(shards)), expected)
+
+
+def test_shared_pool_survives_executors(plan, shards, pool):
+    for _ in range(2):
+        with ParallelExecutor(plan, 2, pool=pool) as executor:
+            executor.run(shards[:1])
+    # Closing an executor leaves a pool it was given running
+    assert pool.submit(sum, [1, 2]).result() == 3
+
+
+def test_cancel_stops_before_next_shard(plan, shards, pool):
+    cancel = threading.Event()
+    done = []
+
+    def progress(count: int):
+        done.append(count)
+        cancel.set()
+
+    executor = ParallelExecutor(plan, 2, in_flight=1, pool=pool)
+    executor.run(shards, progress, cancel)
+    assert done == [1]
@@ -0,0 +1,84 @@
+import itertools
+import random
+
+import pytest
+
+from command.partials import Grouped, Segments, dump_partial, load_partial, merge_all
+
+
+def track(n: int, seed: int = 0) -> list[tuple]:
+    rng = random.Random(seed)
+    t, lat, lon = 0, 55.0, 12.0
+    points = []
+    for _ in range(n):
+        t += rng.randint(1, 120)
+        lat += rng.uniform(-0.01, 0.01)
+        lon += rng.uniform(-0.01, 0.01)
+        points.append((t, lat, lon))
+    return points
+
+
+def segments(points: list[tuple], function: str = 'haversine') -> Segments:
+    partial = Segments(function)
+    partial.extend(points)
+    return partial
+
+
+def pieces(points: list[tuple], bounds: list[int]) -> list[Segments]:
+    edges = [0, *bounds, len(points)]
+    return [segments(points[a:b]) for a, b in zip(edges, edges[1:])]
+
+
+@pytest.mark.parametrize('function', ['haversine', 'diff'])
+def test_segments_merge_any_order(function):
+    points = track(200)
+    expected = segments(points, function).result()
+    for order in itertools.permutations(range(4)):
+        parts = [segments(part, function) for part in (points[:30], points[30:90], points[90:91], points[91:])]
+        merged = Segments(function)
+        for i in order:
+            merged.merge(parts[i])
+        assert merged.result() == pytest.approx(expected)
+
+
+def test_segments_merge_trees():
+    points = track(300, seed=1)
+    expected = segments(points).result()
+    rng = random.Random(2)
+    for _ in range(20):
+        parts = pieces(points, sorted(rng.sample(range(1, 300), 7)))
+        # Merge random pairs until one is left, as partials meet in a reduce tree
+        while len(parts) > 1:
+            a, b = rng.sample(range(len(parts)), 2)
+            parts[a].merge(parts[b])
+            parts.pop(b)
+        assert parts[0].result() == pytest.approx(expected)
+
+
+def test_segments_extend_out_of_order():
+    points = track(100, seed=3)
+    partial = segments(points[50:])
+    partial.extend(points[:50])
+    assert partial.result() == pytest.approx(segments(points).result())
+
+
+def test_segments_survive_serialization():
+    points = track(100, seed=4)
+    first, second = pieces(points, [40])
+    restored = load_partial(dump_partial(second))
+    restored.merge(load_partial(dump_partial(first)))
+    assert restored.result() == pytest.approx(segments(points).result())
+
+
+def test_grouped_merge_all_order():
+    vessels = {mmsi: track(60, seed=mmsi) for mmsi in range(5)}
+    halves = []
+    for half in (slice(None, 30), slice(30, None)):
+        halves.append({'distance': Grouped({mmsi: segments(points[half]) for mmsi, points in vessels.items()})})
+    merged = merge_all({'distance': Grouped()}, halves[1])
+    merge_all(merged, halves[0])
+    expected = {mmsi: segments(points).result() for mmsi, points in vessels.items()}
+    result = merged['distance'].result()
+    assert result.keys() == expected.keys()
+    for mmsi, value in expected.items():
+        assert result[mmsi] == pytest.approx(value)
@@ -0,0 +1,59 @@
+import asyncio
+import threading
+from uuid import uuid4
+
+from command.distributed import DistributedExecutor
+from command.engine import Executor
+from command.scheduler import SpeculativeScheduler
+from net.node import Network, Node
+from net.tcp import TCPConnection
+
+from .conftest import assert_close
+
+
+def test_requeue_on_removed_slot():
+    ran: list[tuple[str, int]] = []
+
+    async def launch(slot, partition, attempt):
+        if slot == 'gone':
+            # Never answers, like a peer that dropped off the network
+            await asyncio.Event().wait()
+        ran.append((slot, partition))
+        return partition * 10
+
+    async def main():
+        scheduler = SpeculativeScheduler(['local', 'gone'], launch, speculation=float('inf'), poll=0.01)
+        asyncio.get_running_loop().call_later(0.1, scheduler.remove_slot, 'gone')
+        return await scheduler.run(4)
+
+    assert asyncio.run(main()) == [0, 10, 20, 30]
+    assert sorted(partition for _, partition in ran) == [0, 1, 2, 3]
+    assert all(slot == 'local' for slot, _ in ran)
+
+
+def test_distributed_requeues_partitions_of_removed_node(plan, shards):
+    network = Network()
+    node = Node(uuid4())
+    node.add_connection(TCPConnection('127.0.0.1', 9))
+    network.add_node(node)
+
+    executor = DistributedExecutor(network, plan, partition_size=1, speculation=float('inf'))
+    stalled = threading.Event()
+
+    async def run_remote(plan, executor, node, shards, attempt=None):
+        stalled.set()
+        await asyncio.Event().wait()
+
+    executor._run_remote = run_remote
+    # OnRemove arrives from a discovery thread while the job runs
+    remover = threading.Thread(target=lambda: stalled.wait(5) and network.remove_node(node.id))
+    remover.start()
+    try:
+        results = asyncio.run(executor.collect(shards))
+    finally:
+        remover.join()
+
+    assert stalled.is_set()
+    assert node.id not in network.nodes
+    local = Executor(plan)
+    assert_close(results, local.finalize(local.run(shards)))
@@ -0,0 +1,120 @@
+import bisect
+import random
+
+import pytest
+
+from command.engine import Executor
+from command.partials import Segments, dump_partial, load_partial
+from command.plan import Plan
+from command.sketches import KLL, HeavyHitters, HyperLogLog, TopSegments
+
+
+def split(values: list, parts: int) -> list[list]:
+    size = -(-len(values) // parts)
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+@pytest.mark.parametrize('error', [0.05, 0.02])
+def test_hll_error(error):
+    distinct = 50_000
+    parts = []
+    for chunk in split([f'vessel-{i}' for i in range(distinct)] * 2, 4):
+        sketch = HyperLogLog.for_error(error)
+        for value in chunk:
+            sketch.add(value)
+        parts.append(sketch)
+    merged = load_partial(dump_partial(parts[0]))
+    for sketch in parts[1:]:
+        merged.merge(sketch)
+    # Four standard errors
+    assert abs(merged.result() - distinct) <= 4 * error * distinct
+
+
+def test_hll_rejects_unreachable_error(plan):
+    assert HyperLogLog.for_error(HyperLogLog.MIN_ERROR).precision == HyperLogLog.MAX_PRECISION
+    with pytest.raises(ValueError):
+        HyperLogLog.for_error(0.001)
+    with pytest.raises(ValueError):
+        Executor(Plan(plan.id, plan.operations, approximate={'nunique': 0.001}))
+
+
+def test_hll_rejects_other_precision():
+    with pytest.raises(ValueError):
+        HyperLogLog(10).merge(HyperLogLog(12))
+
+
+@pytest.mark.parametrize('error', [0.05, 0.01])
+def test_kll_rank_error(error):
+    rng = random.Random(0)
+    values = [rng.lognormvariate(0, 1) for _ in range(20_000)]
+    merged = KLL.for_error(error)
+    for chunk in split(values, 5):
+        sketch = KLL.for_error(error)
+        for value in chunk:
+            sketch.add(value)
+        merged.merge(load_partial(dump_partial(sketch)))
+
+    ordered = sorted(values)
+    for q in (0.1, 0.25, 0.5, 0.75, 0.9, 0.99):
+        rank = bisect.bisect_right(ordered, merged.quantile(q)) / len(ordered)
+        assert abs(rank - q) <= 2 * error
+
+
+def test_heavy_hitters_undercount_bound():
+    rng = random.Random(1)
+    keys = [min(int(rng.paretovariate(1.2)), 5000) for _ in range(30_000)]
+    exact: dict[int, int] = {}
+    for key in keys:
+        exact[key] = exact.get(key, 0) + 1
+
+    error = 0.01
+    merged = HeavyHitters.for_error(error)
+    for chunk in split(keys, 3):
+        sketch = HeavyHitters.for_error(error)
+        for key in chunk:
+            sketch.add(key)
+        merged.merge(sketch)
+
+    assert merged.total == len(keys)
+    for key, count in exact.items():
+        estimate = merged.counters.get(key, 0)
+        assert count - error * len(keys) <= estimate <= count
+    # Every key above the error bound is still tracked
+    assert all(key in merged.counters for key, count in exact.items() if count > error * len(keys))
+
+
+def test_top_segments_exact_with_spare_counters():
+    rng = random.Random(2)
+    tracks = {}
+    for mmsi in range(40):
+        t, points = 0, []
+        for _ in range(rng.randint(5, 60)):
+            t += rng.randint(1, 60)
+            points.append((t, 55 + rng.uniform(-1, 1), 12 + rng.uniform(-1, 1)))
+        tracks[mmsi] = points
+
+    exact = {}
+    for mmsi, points in tracks.items():
+        segments = Segments('haversine')
+        segments.extend(points)
+        exact[mmsi] = segments.total
+    expected = sorted(exact.items(), key=lambda item: item[1], reverse=True)[:5]
+
+    # Each batch sees a time slice of every track, and batches arrive out of order
+    batches = []
+    for start in range(0, 60, 15):
+        sketch = TopSegments.for_error(0.01)
+        groups = {}
+        for mmsi, points in tracks.items():
+            if points[start:start + 15]:
+                groups[mmsi] = Segments('haversine')
+                groups[mmsi].extend(points[start:start + 15])
+        sketch.add_batch(groups)
+        batches.append(sketch)
+    merged = load_partial(dump_partial(batches[2]))
+    for i in (0, 3, 1):
+        merged.merge(batches[i])
+
+    top = merged.top(5)
+    assert [key for key, _ in top] == [key for key, _ in expected]
+    assert [value for _, value in top] == pytest.approx([value for _, value in expected])
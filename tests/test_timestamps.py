@@ -0,0 +1,58 @@
+from datetime import datetime
+
+import pytest
+
+from command.timestamps import TIMESTAMP_FORMATS, TimestampFormat, detect_format, parse_timestamp
+
+MOMENTS = [
+    datetime(1970, 1, 1), datetime(2024, 2, 29, 23, 59, 59), datetime(2023, 12, 31, 12, 30, 5),
+    datetime(2024, 1, 1, 0, 0, 1), datetime(2038, 1, 19, 3, 14, 8),
+]
+
+
+@pytest.mark.parametrize('fmt', TIMESTAMP_FORMATS)
+def test_fast_path_matches_strptime(fmt):
+    decoder = TimestampFormat(fmt)
+    assert decoder.fixed
+    for moment in MOMENTS:
+        value = moment.strftime(fmt)
+        assert decoder.decode(value) == parse_timestamp(value, (fmt,)) is not None
+
+
+@pytest.mark.parametrize('value', [
+    '',
+    '31/02/2024 10:00:00',  # no such day
+    '01/01/2024 24:00:00',
+    '01/01/2024 10:60:00',
+    '01/01/2024 10:00:60',
+    '01/01/2024 +1:00:00',  # int() would take the sign
+    ' 1/01/2024 10:00:00',  # strptime takes a padded day, int() a padded anything
+    '01/01/2024 10: 0:00',
+    '1/1/2024 10:00:00',  # shorter than the layout
+    '01-01-2024 10:00:00',
+    '2024-01-01T10:00:00',  # another known format
+    'not a timestamp',
+])
+def test_malformed_values_take_the_slow_path(value):
+    decoder = TimestampFormat(TIMESTAMP_FORMATS[0])
+    assert decoder.decode(value) == parse_timestamp(value, TIMESTAMP_FORMATS)
+
+
+def test_day_part_is_cached_per_date():
+    decoder = TimestampFormat(TIMESTAMP_FORMATS[0])
+    first = decoder.decode('05/03/2024 00:00:00')
+    assert decoder.decode('05/03/2024 01:02:03') == first + 3723
+    assert len(decoder._days) == 1
+
+
+def test_unsupported_directives_use_strptime():
+    decoder = TimestampFormat('%Y-%m-%d %H:%M:%S.%f')
+    assert not decoder.fixed
+    assert decoder.decode('2024-01-01 10:00:00.5') == parse_timestamp('2024-01-01 10:00:00', TIMESTAMP_FORMATS)
+
+
+def test_detect_format():
+    for fmt in TIMESTAMP_FORMATS:
+        assert detect_format(['', datetime(2024, 1, 2, 3, 4, 5).strftime(fmt)]).fmt == fmt
+    assert detect_format(['garbage', '2024-01-01 00:00:00']).fmt == TIMESTAMP_FORMATS[0]
+    assert detect_format([]).fmt == TIMESTAMP_FORMATS[0]
@@ -0,0 +1,57 @@
+from array import array
+
+from command import engine
+from command.engine import Executor, TrajectoryIndex
+from command.partials import haversine
+
+from .conftest import assert_close
+
+
+def test_index_sorts_rows_by_key_and_time():
+    index = TrajectoryIndex(['b', 'a', 'b', 'a', 'c'], array('q', [5, 3, 1, 4, 2]))
+    assert list(index.order) == [1, 3, 2, 0, 4]
+    assert index.keys == ['a', 'b', 'c']
+    assert list(index.offsets) == [0, 2, 4, 5]
+    assert list(index.groups()) == [('a', 0, 2), ('b', 2, 4), ('c', 4, 5)]
+
+    empty = TrajectoryIndex([], array('q'))
+    assert len(empty) == 0 and list(empty.offsets) == [0] and list(empty.groups()) == []
+
+
+def test_operators_share_one_index(plan, shards, monkeypatch):
+    built = []
+
+    class Counting(TrajectoryIndex):
+        def __init__(self, keys, times):
+            built.append(1)
+            super().__init__(keys, times)
+
+    monkeypatch.setattr(engine, 'TrajectoryIndex', Counting)
+    executor = Executor(plan)
+    table = executor.load(shards[0])
+    executor.run_table(table)
+    # AvgDistance, AvgTimeStep and Top5LongestDistances all walk the same MMSI index
+    assert len(built) == 1
+    assert table.trajectories('MMSI') is table.trajectories('MMSI')
+    assert len(built) == 1
+
+
+def test_indexed_segments_match_sorting_each_group(plan, shards):
+    executor = Executor(plan)
+    table = executor.load(shards[0])
+    results = executor.finalize(executor.run_table(table))
+
+    tracks = {}
+    for mmsi, t, lat, lon in zip(table.column('MMSI'), table.timestamps(),
+                                 table.column('Latitude'), table.column('Longitude')):
+        tracks.setdefault(mmsi, []).append((t, lat, lon))
+    distances, steps = {}, {}
+    for mmsi, points in tracks.items():
+        points.sort(key=lambda point: point[0])
+        pairs = list(zip(points, points[1:]))
+        distances[mmsi] = sum(haversine(a, b) for a, b in pairs) / len(pairs) if pairs else None
+        steps[mmsi] = sum(b[0] - a[0] for a, b in pairs) / len(pairs) if pairs else None
+
+    assert distances
+    assert_close(results['AvgDistance'], distances)
+    assert_close(results['AvgTimeStep'], steps)